@@ -0,0 +1,146 @@
+"""
+api/answer_cache.py
+- Persistent answer cache for case QA (Postgres table qa_answer_cache, see db/002_qa_answer_cache.sql).
+- Key: case id, case generation, normalized question, ordered top chunk ids and LLM model name.
+- Case generation comes from the mtimes of parsed/chunks.jsonl and parsed/milvus_stamp.json, so re-parsing or
+  re-indexing a case changes every key; workers/index_builder.py also deletes the case's rows after a Postgres re-index.
+- Single-flight: concurrent identical questions share one in-flight LLM call.
+"""
+import os, re, json, hashlib, asyncio, unicodedata
+
+_WS = re.compile(r"\s+")
+_TRAILING_PUNCT = re.compile(r"[?？。.!！\s]+$")
+
+def normalize_question(q: str) -> str:
+    q = _WS.sub(" ", unicodedata.normalize("NFKC", q or "")).strip().lower()
+    return _TRAILING_PUNCT.sub("", q)
+
+class AnswerCache:
+    def __init__(self, conn_factory, backend, cases_root: str="/data/cases", enabled: bool=True):
+        """
+        conn_factory: context manager yielding a psycopg2 connection (api.main.sql_conn)
+        backend: api.backends.Backend used to run the blocking SQL
+        """
+        self.conn_factory = conn_factory
+        self.backend = backend
+        self.cases_root = cases_root
+        self.enabled = enabled
+        self._inflight = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "stores": 0, "errors": 0}
+
+    def generation(self, case_id: str) -> str:
+        parts = []
+        for name in ("chunks.jsonl", "milvus_stamp.json"):
+            try:
+                parts.append(str(os.stat(os.path.join(self.cases_root, case_id, "parsed", name)).st_mtime_ns))
+            except OSError:
+                parts.append("0")
+        return ":".join(parts)
+
+    def make_key(self, case_id: str, question: str, chunk_ids, model: str):
+        gen = self.generation(case_id)
+        raw = json.dumps([case_id, gen, normalize_question(question), list(chunk_ids), model], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest(), gen
+
+    # --- persistence (blocking; run on the db backend) ---
+    def _get(self, key):
+        with self.conn_factory() as con, con.cursor() as cur:
+            cur.execute("UPDATE qa_answer_cache SET hits = hits + 1 WHERE cache_key=%s RETURNING answer", (key,))
+            row = cur.fetchone()
+        return row[0] if row else None
+
+    def _put(self, key, case_id, generation, question, model, chunk_ids, answer, citations):
+        with self.conn_factory() as con, con.cursor() as cur:
+            cur.execute("""INSERT INTO qa_answer_cache(cache_key, case_id, case_generation, question, model, chunk_ids, answer, citations)
+                           VALUES (%s,%s,%s,%s,%s,%s,%s,%s)
+                           ON CONFLICT (cache_key) DO UPDATE SET answer=EXCLUDED.answer, citations=EXCLUDED.citations, created_at=now()""",
+                        (key, case_id, generation, question, model, list(chunk_ids), answer, json.dumps(citations, ensure_ascii=False)))
+            # rows from earlier generations of this case can never hit again
+            cur.execute("DELETE FROM qa_answer_cache WHERE case_id=%s AND case_generation IS DISTINCT FROM %s", (case_id, generation))
+
+    async def get(self, key):
+        if not self.enabled:
+            return None
+        try:
+            answer = await self.backend.run_sync(self._get, key)
+        except Exception as e:
+            self.stats["errors"] += 1
+            print("[warn] answer cache lookup failed:", repr(e))
+            return None
+        self.stats["hits" if answer is not None else "misses"] += 1
+        return answer
+
+    async def put(self, key, **entry):
+        if not self.enabled:
+            return
+        try:
+            await self.backend.run_sync(self._put, key, **entry)
+            self.stats["stores"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            print("[warn] answer cache store failed:", repr(e))
+
+    # --- single-flight ---
+    def claim(self, key):
+        """
+        Returns (future, leader). The leader must call release(); followers await wait(future).
+        No await between lookup and insert, so claiming is atomic on the event loop.
+        """
+        fut = self._inflight.get(key)
+        if fut is not None:
+            return fut, False
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        return fut, True
+
+    def release(self, key, answer=None):
+        fut = self._inflight.pop(key, None)
+        if fut is not None and not fut.done():
+            if answer is None:
+                fut.cancel()
+            else:
+                fut.set_result(answer)
+
+    async def wait(self, fut):
+        """
+        Await a leader's answer; returns None if the leader failed so the caller can compute it itself.
+        """
+        try:
+            answer = await asyncio.shield(fut)
+        except asyncio.CancelledError:
+            if not fut.cancelled():
+                raise
+            return None
+        self.stats["coalesced"] += 1
+        return answer
+
+    async def get_or_compute(self, key, compute, entry: dict):
+        """
+        compute: async () -> (answer, cacheable). entry: columns for put() besides key and answer.
+        Returns (answer, source) with source "cache", "coalesced" or "llm".
+        """
+        fut, leader = self.claim(key)
+        if not leader:
+            answer = await self.wait(fut)
+            if answer is not None:
+                return answer, "coalesced"
+            return await self.get_or_compute(key, compute, entry)
+        answer = None
+        try:
+            answer = await self.get(key)
+            if answer is not None:
+                return answer, "cache"
+            answer, cacheable = await compute()
+            if cacheable:
+                await self.put(key, answer=answer, **entry)
+            return answer, "llm"
+        finally:
+            self.release(key, answer)
+
+    def snapshot(self):
+        s = dict(self.stats)
+        lookups = s["hits"] + s["misses"]
+        s["hit_ratio"] = round(s["hits"] / lookups, 4) if lookups else 0.0
+        s["inflight"] = len(self._inflight)
+        s["enabled"] = self.enabled
+        return s
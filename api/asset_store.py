@@ -0,0 +1,187 @@
+"""
+api/asset_store.py
+- Streaming, content-addressed store for uploaded case assets (/ingest/case).
+- Uploads are copied to a temp file in fixed-size chunks while a sha256 is computed, so API memory stays
+  flat regardless of file size; the file then moves to /data/blobs/sha256/<ab>/<sha256> (kept once across cases).
+- The case's assets/<filename> is a hard link to the blob, so workers keep reading /data/cases/<id>/assets.
+- Optionally mirrors blobs to the object store (storage.object, S3 API via boto3) under blobs/<sha256>,
+  skipping objects that already exist.
+- Assets are recorded in case_assets (see db/003_case_assets_content.sql).
+"""
+import os, uuid, shutil, asyncio, hashlib, mimetypes
+
+CHUNK_SIZE = 1 << 20
+
+AUDIO_EXTS = (".mp3", ".wav", ".m4a", ".aac", ".flac", ".amr")
+VIDEO_EXTS = (".mp4", ".mov", ".avi", ".mkv", ".wmv", ".flv")
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".bmp", ".tiff")
+
+def asset_type(filename: str) -> str:
+    low = filename.lower()
+    if low.endswith(".pdf"):
+        return "pdf"
+    if low.endswith(IMAGE_EXTS):
+        return "image"
+    if low.endswith(AUDIO_EXTS):
+        return "audio"
+    if low.endswith(VIDEO_EXTS):
+        return "video"
+    if low.endswith((".docx", ".doc")):
+        return "docx"
+    if low.endswith(".txt"):
+        return "text"
+    return mimetypes.guess_type(filename)[0] or "other"
+
+def safe_filename(name: str) -> str:
+    name = os.path.basename((name or "").replace("\\", "/")).strip()
+    if name in ("", ".", ".."):
+        raise ValueError("invalid file name")
+    return name
+
+class AssetStore:
+    def __init__(self, conn_factory, backend, blob_root: str="/data/blobs", cases_root: str="/data/cases",
+                 object_conf: dict=None, chunk_size: int=CHUNK_SIZE):
+        """
+        conn_factory: context manager yielding a psycopg2 connection (api.main.sql_conn)
+        backend: api.backends.Backend used to run the blocking SQL
+        object_conf: storage.object from configs/app.yaml; blobs are mirrored when it has mirror: true
+        """
+        self.conn_factory = conn_factory
+        self.backend = backend
+        self.blob_root = blob_root
+        self.cases_root = cases_root
+        self.chunk_size = int(chunk_size)
+        self.object_conf = object_conf or {}
+        self._s3 = None
+        self.stats = {"files": 0, "bytes": 0, "deduplicated": 0, "mirrored": 0, "errors": 0}
+
+    def blob_path(self, sha: str) -> str:
+        return os.path.join(self.blob_root, "sha256", sha[:2], sha)
+
+    async def _spool(self, upload):
+        """
+        Copy the upload to a temp file chunk by chunk; returns (tmp path, sha256, size).
+        """
+        tmp_dir = os.path.join(self.blob_root, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        tmp = os.path.join(tmp_dir, uuid.uuid4().hex)
+        h, size = hashlib.sha256(), 0
+        out = await asyncio.to_thread(open, tmp, "wb")
+        try:
+            while True:
+                block = await upload.read(self.chunk_size)
+                if not block:
+                    break
+                h.update(block)
+                size += len(block)
+                await asyncio.to_thread(out.write, block)
+        except BaseException:
+            out.close()
+            os.unlink(tmp)
+            raise
+        await asyncio.to_thread(out.close)
+        return tmp, h.hexdigest(), size
+
+    def _commit_blob(self, tmp, sha):
+        """
+        Move the temp file into the blob store unless the blob already exists. Returns (path, deduplicated).
+        """
+        dst = self.blob_path(sha)
+        if os.path.exists(dst):
+            os.unlink(tmp)
+            return dst, True
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        os.replace(tmp, dst)
+        return dst, False
+
+    def _link_into_case(self, blob, case_id, filename):
+        assets = os.path.join(self.cases_root, case_id, "assets")
+        os.makedirs(assets, exist_ok=True)
+        dst = os.path.join(assets, filename)
+        tmp = dst + ".tmp"
+        if os.path.lexists(tmp):
+            os.unlink(tmp)
+        try:
+            os.link(blob, tmp)
+        except OSError:
+            # blob store on another filesystem
+            shutil.copyfile(blob, tmp)
+        os.replace(tmp, dst)
+        return dst
+
+    def _s3_client(self):
+        if self._s3 is None:
+            import boto3
+            self._s3 = boto3.client("s3", endpoint_url=self.object_conf.get("endpoint"),
+                                    aws_access_key_id=self.object_conf.get("access_key"),
+                                    aws_secret_access_key=self.object_conf.get("secret_key"))
+        return self._s3
+
+    def _mirror(self, blob, sha):
+        """
+        Upload the blob to the object store once (multipart from disk); returns its URI or None.
+        """
+        if not self.object_conf.get("mirror"):
+            return None
+        bucket = self.object_conf.get("bucket", "legal-data")
+        key = f"blobs/{sha}"
+        s3 = self._s3_client()
+        try:
+            s3.head_object(Bucket=bucket, Key=key)
+        except Exception:
+            s3.upload_file(blob, bucket, key)
+            self.stats["mirrored"] += 1
+        return f"s3://{bucket}/{key}"
+
+    def _record(self, case_id, filename, path, sha, size, blob_uri):
+        with self.conn_factory() as con, con.cursor() as cur:
+            cur.execute("INSERT INTO cases(case_id) VALUES (%s) ON CONFLICT (case_id) DO NOTHING", (case_id,))
+            cur.execute("""INSERT INTO case_assets(case_id, filename, type, path, sha256, size, blob_uri)
+                           VALUES (%s,%s,%s,%s,%s,%s,%s)
+                           ON CONFLICT (case_id, filename) DO UPDATE SET type=EXCLUDED.type, path=EXCLUDED.path,
+                             sha256=EXCLUDED.sha256, size=EXCLUDED.size, blob_uri=EXCLUDED.blob_uri, created_at=now()
+                           RETURNING asset_id""",
+                        (case_id, filename, asset_type(filename), path, sha, size, blob_uri))
+            return cur.fetchone()[0]
+
+    async def save(self, case_id: str, upload):
+        """
+        Stream one UploadFile into the store and record it. Returns the asset record.
+        """
+        filename = safe_filename(upload.filename)
+        tmp, sha, size = await self._spool(upload)
+        blob, dedup = await asyncio.to_thread(self._commit_blob, tmp, sha)
+        path = await asyncio.to_thread(self._link_into_case, blob, case_id, filename)
+        blob_uri = None
+        try:
+            blob_uri = await asyncio.to_thread(self._mirror, blob, sha)
+        except Exception as e:
+            self.stats["errors"] += 1
+            print("[warn] object store mirror failed:", repr(e))
+        asset = {"filename": filename, "path": path, "sha256": sha, "size": size,
+                 "type": asset_type(filename), "deduplicated": dedup, "blob_uri": blob_uri}
+        try:
+            asset["asset_id"] = await self.backend.run_sync(self._record, case_id, filename, path, sha, size,
+                                                            blob_uri or blob)
+        except Exception as e:
+            # the file is on disk either way; listing falls back to the assets dir
+            self.stats["errors"] += 1
+            print("[warn] case_assets insert failed:", repr(e))
+        self.stats["files"] += 1
+        self.stats["bytes"] += size
+        self.stats["deduplicated"] += dedup
+        return asset
+
+    def _list(self, case_id):
+        with self.conn_factory() as con, con.cursor() as cur:
+            cur.execute("""SELECT asset_id, filename, type, path, sha256, size, blob_uri, created_at
+                           FROM case_assets WHERE case_id=%s ORDER BY filename""", (case_id,))
+            rows = cur.fetchall()
+        return [{"asset_id": r[0], "filename": r[1], "type": r[2], "path": r[3], "sha256": r[4], "size": r[5],
+                 "blob_uri": r[6], "created_at": r[7].isoformat() if r[7] else None} for r in rows]
+
+    async def list(self, case_id: str):
+        return await self.backend.run_sync(self._list, case_id)
+
+    def snapshot(self):
+        return dict(self.stats)
@@ -0,0 +1,138 @@
+"""
+api/backends.py
+- Per-dependency gates for the async QA path: each backend (db, embed, milvus, rerank, llm)
+  gets its own concurrency limit, timeout and thread pool, so one saturated backend
+  degrades alone instead of stalling the event loop.
+"""
+import asyncio, functools, time
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+class BackendTimeout(asyncio.TimeoutError):
+    pass
+
+class Backend:
+    def __init__(self, name: str, limit: int=4, timeout: float=30.0, threads: int=None):
+        self.name = name
+        self.limit = int(limit)
+        self.timeout = float(timeout)
+        self._threads = int(threads or limit)
+        self._executor = None
+        self._sem = None
+        self.stats = {"calls": 0, "errors": 0, "timeouts": 0, "in_flight": 0, "waiting": 0, "total_ms": 0.0}
+
+    @property
+    def sem(self):
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.limit)
+        return self._sem
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._threads, thread_name_prefix=f"be-{self.name}")
+        return self._executor
+
+    async def _acquire(self, deadline):
+        self.stats["waiting"] += 1
+        try:
+            await asyncio.wait_for(self.sem.acquire(), max(deadline - time.monotonic(), 0.001))
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            raise BackendTimeout(f"{self.name}: no free slot within {self.timeout}s")
+        finally:
+            self.stats["waiting"] -= 1
+        self.stats["in_flight"] += 1
+
+    def _release(self, *_):
+        self.stats["in_flight"] -= 1
+        self.sem.release()
+
+    def _done(self, t0, failed):
+        self.stats["calls"] += 1
+        self.stats["errors"] += int(failed)
+        self.stats["total_ms"] += (time.monotonic() - t0) * 1000
+
+    async def run_sync(self, fn, *args, timeout: float=None, **kwargs):
+        """
+        Run a blocking callable on this backend's thread pool.
+        The slot is held until the thread finishes, even if the caller times out,
+        so the concurrency limit reflects real work in flight.
+        """
+        t0 = time.monotonic()
+        deadline = t0 + (timeout or self.timeout)
+        await self._acquire(deadline)
+        loop = asyncio.get_running_loop()
+        try:
+            fut = loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+        except Exception:
+            self._release()
+            raise
+        # asyncio futures run done-callbacks on the loop thread
+        fut.add_done_callback(self._release)
+        failed = True
+        try:
+            result = await asyncio.wait_for(asyncio.shield(fut), max(deadline - time.monotonic(), 0.001))
+            failed = False
+            return result
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            raise BackendTimeout(f"{self.name}: timed out after {timeout or self.timeout}s")
+        finally:
+            self._done(t0, failed)
+
+    async def run(self, coro_fn, *args, timeout: float=None, **kwargs):
+        """
+        Await an async callable under this backend's limit and timeout.
+        """
+        t0 = time.monotonic()
+        deadline = t0 + (timeout or self.timeout)
+        await self._acquire(deadline)
+        failed = True
+        try:
+            result = await asyncio.wait_for(coro_fn(*args, **kwargs), max(deadline - time.monotonic(), 0.001))
+            failed = False
+            return result
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            raise BackendTimeout(f"{self.name}: timed out after {timeout or self.timeout}s")
+        finally:
+            self._release()
+            self._done(t0, failed)
+
+    @asynccontextmanager
+    async def slot(self, timeout: float=None):
+        """
+        Hold one slot for a long-lived call such as a streamed response; the timeout covers only the wait.
+        """
+        t0 = time.monotonic()
+        await self._acquire(t0 + (timeout or self.timeout))
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            self._release()
+            self._done(t0, failed)
+
+    def snapshot(self):
+        s = dict(self.stats)
+        s["limit"] = self.limit
+        s["timeout"] = self.timeout
+        s["avg_ms"] = round(s["total_ms"] / s["calls"], 2) if s["calls"] else 0.0
+        return s
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+def build_backends(conf: dict, defaults: dict):
+    """
+    conf/defaults: {name: {"limit": int, "timeout": float, "threads": int}}
+    """
+    out = {}
+    for name, d in defaults.items():
+        c = dict(d)
+        c.update(conf.get(name, {}) or {})
+        out[name] = Backend(name, limit=c.get("limit", 4), timeout=c.get("timeout", 30), threads=c.get("threads"))
+    return out
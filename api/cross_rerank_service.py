@@ -1,30 +1,300 @@
-from fastapi import FastAPI, Body
+from fastapi import FastAPI, Body, HTTPException
 from pydantic import BaseModel
 from typing import List, Dict, Any
-import os, json
-from sentence_transformers import CrossEncoder
+import os, json, time, queue, asyncio, threading, hashlib, re, unicodedata
+from collections import OrderedDict
+from workers.onnx_backend import load_cross_encoder, default_backend, export_dir
 
 app = FastAPI(title="CrossEncoder Rerank Service")
 
 MODEL_NAME = os.environ.get("CROSS_ENCODER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# torch | onnx; fixed for the life of the process (scores differ between backends)
+INFERENCE_BACKEND = default_backend()
+# Batching budget: pairs per batch and padded length budget (max pair length * pairs, ~chars ≈ tokens for zh)
+MAX_BATCH_PAIRS = int(os.environ.get("RERANK_MAX_BATCH_PAIRS", 64))
+MAX_BATCH_TOKENS = int(os.environ.get("RERANK_MAX_BATCH_TOKENS", 16384))
+MAX_WAIT_MS = float(os.environ.get("RERANK_MAX_WAIT_MS", 5))
+MAX_PAIR_LEN = int(os.environ.get("RERANK_MAX_PAIR_LEN", 512))
+# Upper bound on how long a request waits for its scores (queueing + inference)
+REQUEST_TIMEOUT_S = float(os.environ.get("RERANK_TIMEOUT_S", 30))
+# Pair-score cache: local LRU, plus an optional shared Redis so all rerank replicas benefit
+SCORE_CACHE_SIZE = int(os.environ.get("RERANK_CACHE_SIZE", 200000))
+SCORE_CACHE_REDIS_URL = os.environ.get("RERANK_CACHE_REDIS_URL", "")
+SCORE_CACHE_TTL = int(os.environ.get("RERANK_CACHE_TTL", 7 * 24 * 3600))
+
 _ce = None
 def get_model():
     global _ce
     if _ce is None:
-        _ce = CrossEncoder(MODEL_NAME)
+        # INFERENCE_BACKEND=onnx switches to the int8 onnxruntime path
+        _ce = load_cross_encoder(MODEL_NAME, INFERENCE_BACKEND)
     return _ce
 
+def quantization(model_name: str, backend: str) -> str:
+    """
+    Weight precision the scores come from: "fp32" for torch; for onnx the exported model file
+    (meta.json), else what export_cross_encoder() will produce (int8).
+    """
+    if backend != "onnx":
+        return "fp32"
+    try:
+        with open(os.path.join(export_dir("rerank", model_name), "meta.json"), "r", encoding="utf-8") as f:
+            return "int8" if json.load(f).get("quantized", True) else "fp32"
+    except (OSError, ValueError):
+        return "int8"
+
+class _Job:
+    """One /rerank request: collects scores for its pairs and resolves the caller's future."""
+    def __init__(self, loop, n):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.scores = [None] * n
+        self.remaining = n
+
+    def _resolve(self, fn, arg):
+        if not self.future.done():
+            fn(arg)
+
+    def set_score(self, i, s):
+        self.scores[i] = s
+        self.remaining -= 1
+        if self.remaining == 0:
+            self.loop.call_soon_threadsafe(self._resolve, self.future.set_result, self.scores)
+
+    def fail(self, e):
+        self.loop.call_soon_threadsafe(self._resolve, self.future.set_exception, e)
+
+class BatchScheduler:
+    """
+    Cross-request dynamic batching for the cross-encoder.
+    Pairs from all in-flight requests go into one queue; a dedicated worker thread drains it,
+    sorts pairs by length, cuts batches by pair and padded-token budget and runs inference,
+    then routes each score back to its request.
+    """
+    def __init__(self, max_pairs=64, max_tokens=16384, max_wait_ms=5.0, max_pair_len=512, timeout_s=30.0):
+        self.max_pairs = max_pairs
+        self.timeout = timeout_s
+        self.error = None  # model load failure: fails every pending and future job
+        self.max_tokens = max_tokens
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_pair_len = max_pair_len
+        self._q = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "pairs": 0, "batches": 0, "rounds": 0, "busy_s": 0.0, "max_batch": 0, "batch_hist": {}}
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="rerank-batcher", daemon=True)
+                self._thread.start()
+
+    async def submit(self, query: str, texts: List[str]):
+        """
+        Enqueue (query, text) pairs and wait for their scores in input order.
+        Raises the model load / inference error, or asyncio.TimeoutError after self.timeout seconds.
+        """
+        self.start()
+        if not texts:
+            return []
+        if self.error is not None:
+            raise self.error
+        job = _Job(asyncio.get_running_loop(), len(texts))
+        self.stats["requests"] += 1
+        for i, t in enumerate(texts):
+            n = min(len(query) + len(t), self.max_pair_len)
+            self._q.put((n, query, t, job, i))
+        return await asyncio.wait_for(job.future, self.timeout)
+
+    def _drain(self):
+        items = [self._q.get()]
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            timeout = deadline - time.monotonic()
+            try:
+                items.append(self._q.get(timeout=timeout) if timeout > 0 else self._q.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _batches(self, items):
+        # length bucketing: similar lengths share a batch so padding stays small
+        items.sort(key=lambda x: x[0])
+        batch, longest = [], 0
+        for it in items:
+            longest_if = max(longest, it[0])
+            if batch and (len(batch) >= self.max_pairs or longest_if * (len(batch) + 1) > self.max_tokens):
+                yield batch
+                batch, longest_if = [], it[0]
+            batch.append(it)
+            longest = longest_if
+        if batch:
+            yield batch
+
+    def _loop(self):
+        try:
+            model = get_model()
+        except Exception as e:
+            # keep the thread alive to fail what is queued now and later instead of leaving callers hanging
+            print(f"[!] cross-encoder {MODEL_NAME} failed to load: {e!r}")
+            self.error = RuntimeError(f"cross-encoder {MODEL_NAME} unavailable: {e!r}")
+            while True:
+                for _, _, _, job, _ in self._drain():
+                    job.fail(self.error)
+        while True:
+            items = self._drain()
+            self.stats["rounds"] += 1
+            for batch in self._batches(items):
+                t0 = time.monotonic()
+                try:
+                    scores = [float(s) for s in model.predict([[q, t] for _, q, t, _, _ in batch], batch_size=len(batch))]
+                except Exception as e:
+                    for _, _, _, job, _ in batch:
+                        job.fail(e)
+                    continue
+                finally:
+                    self.stats["busy_s"] += time.monotonic() - t0
+                for (_, _, _, job, i), s in zip(batch, scores):
+                    job.set_score(i, s)
+                n = len(batch)
+                self.stats["batches"] += 1
+                self.stats["pairs"] += n
+                self.stats["max_batch"] = max(self.stats["max_batch"], n)
+                bucket = 1 << (n - 1).bit_length()
+                self.stats["batch_hist"][bucket] = self.stats["batch_hist"].get(bucket, 0) + 1
+
+    def snapshot(self):
+        s = dict(self.stats)
+        s["batch_hist"] = {f"<={k}": v for k, v in sorted(self.stats["batch_hist"].items())}
+        s["queue_depth"] = self._q.qsize()
+        s["error"] = repr(self.error) if self.error else None
+        s["avg_batch"] = round(s["pairs"] / s["batches"], 2) if s["batches"] else 0.0
+        s["pairs_per_s"] = round(s["pairs"] / s["busy_s"], 1) if s["busy_s"] else 0.0
+        return s
+
+SCHEDULER = BatchScheduler(MAX_BATCH_PAIRS, MAX_BATCH_TOKENS, MAX_WAIT_MS, MAX_PAIR_LEN, REQUEST_TIMEOUT_S)
+
+_WS = re.compile(r"\s+")
+
+def _digest(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+class ScoreCache:
+    """
+    (model, inference backend, quantization, normalized query hash, chunk text hash) -> score.
+    Local LRU in front of an optional Redis backend; Redis errors degrade to local-only.
+    Replicas running another backend or precision get their own key space in the shared Redis.
+    """
+    def __init__(self, model_name, size=200000, redis_url="", ttl=604800, backend="torch", quant="fp32"):
+        self.variant = f"{model_name}|{backend}|{quant}"
+        self.prefix = f"rr:{_digest(self.variant)[:12]}"
+        self.size = size
+        self.ttl = ttl
+        self._local = OrderedDict()
+        self._redis = None
+        if redis_url:
+            try:
+                import redis.asyncio as aioredis
+                self._redis = aioredis.from_url(redis_url)
+            except Exception as e:
+                print("[warn] rerank cache: redis backend unavailable:", e)
+        self.stats = {"lookups": 0, "local_hits": 0, "shared_hits": 0, "misses": 0, "shared_errors": 0}
+
+    def key(self, query: str, text: str) -> str:
+        q = _WS.sub(" ", unicodedata.normalize("NFKC", query)).strip().lower()
+        return f"{self.prefix}:{_digest(q)}:{_digest(text)}"
+
+    def _put_local(self, k, v):
+        self._local[k] = v
+        self._local.move_to_end(k)
+        while len(self._local) > self.size:
+            self._local.popitem(last=False)
+
+    async def get_many(self, keys):
+        self.stats["lookups"] += len(keys)
+        out = [None] * len(keys)
+        remote = []
+        for i, k in enumerate(keys):
+            v = self._local.get(k)
+            if v is None:
+                remote.append(i)
+            else:
+                self._local.move_to_end(k)
+                out[i] = v
+        self.stats["local_hits"] += len(keys) - len(remote)
+        if remote and self._redis is not None:
+            try:
+                vals = await self._redis.mget([keys[i] for i in remote])
+                still = []
+                for i, v in zip(remote, vals):
+                    if v is None:
+                        still.append(i)
+                    else:
+                        out[i] = float(v)
+                        self._put_local(keys[i], out[i])
+                self.stats["shared_hits"] += len(remote) - len(still)
+                remote = still
+            except Exception as e:
+                self.stats["shared_errors"] += 1
+                print("[warn] rerank cache: redis get failed:", e)
+        self.stats["misses"] += len(remote)
+        return out
+
+    async def set_many(self, items):
+        for k, v in items:
+            self._put_local(k, v)
+        if items and self._redis is not None:
+            try:
+                pipe = self._redis.pipeline(transaction=False)
+                for k, v in items:
+                    pipe.set(k, repr(v), ex=self.ttl)
+                await pipe.execute()
+            except Exception as e:
+                self.stats["shared_errors"] += 1
+                print("[warn] rerank cache: redis set failed:", e)
+
+    def snapshot(self):
+        s = dict(self.stats)
+        s["hit_ratio"] = round((s["local_hits"] + s["shared_hits"]) / s["lookups"], 4) if s["lookups"] else 0.0
+        s["local_entries"] = len(self._local)
+        s["shared"] = self._redis is not None
+        s["variant"] = self.variant
+        return s
+
+SCORE_CACHE = ScoreCache(MODEL_NAME, SCORE_CACHE_SIZE, SCORE_CACHE_REDIS_URL, SCORE_CACHE_TTL,
+                         backend=INFERENCE_BACKEND, quant=quantization(MODEL_NAME, INFERENCE_BACKEND))
+
 class RerankReq(BaseModel):
     query: str
     candidates: List[Dict[str, Any]]  # each candidate: {"id": "...", "text": "..."}
 
+@app.on_event("startup")
+def start_scheduler():
+    SCHEDULER.start()
+
 @app.post("/rerank")
 async def rerank(req: RerankReq):
-    model = get_model()
-    pairs = [[req.query, c.get("text","")] for c in req.candidates]
-    scores = model.predict(pairs, batch_size=16)
+    texts = [c.get("text","") for c in req.candidates]
+    keys = [SCORE_CACHE.key(req.query, t) for t in texts]
+    scores = await SCORE_CACHE.get_many(keys)
+    # only cache misses go to the cross-encoder
+    miss = [i for i, s in enumerate(scores) if s is None]
+    if miss:
+        try:
+            fresh = await SCHEDULER.submit(req.query, [texts[i] for i in miss])
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail=f"rerank timed out after {SCHEDULER.timeout:.0f}s")
+        except Exception as e:
+            raise HTTPException(status_code=503, detail=f"rerank failed: {e!r}")
+        for i, s in zip(miss, fresh):
+            scores[i] = s
+        await SCORE_CACHE.set_many([(keys[i], scores[i]) for i in miss])
     out = []
     for c, s in zip(req.candidates, scores):
         out.append({"id": c.get("id"), "score": float(s), "asset": c.get("meta",{}).get("asset"), "page": c.get("meta",{}).get("page")})
     out_sorted = sorted(out, key=lambda x: x["score"], reverse=True)
     return {"results": out_sorted}
+
+@app.get("/metrics")
+async def metrics():
+    return {"model": MODEL_NAME, "scheduler": SCHEDULER.snapshot(), "cache": SCORE_CACHE.snapshot()}
@@ -0,0 +1,109 @@
+"""
+api/embed_batcher.py
+- Async front-end for query embedding.
+- Coalesces concurrent embed() calls that arrive within a short window into one model.encode batch;
+  every caller gets its own row back.
+- Bounded LRU cache keyed by (model name, normalized text) with hit/miss counters.
+"""
+import asyncio, re, unicodedata
+from collections import OrderedDict
+import numpy as np
+
+_WS = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    # NFKC folds full-width ASCII/punctuation so "？" and "?" variants share a cache entry
+    return _WS.sub(" ", unicodedata.normalize("NFKC", text or "")).strip()
+
+class EmbedBatcher:
+    def __init__(self, encode_fn, model_name: str, max_batch: int=32, window_ms: float=5.0,
+                 cache_size: int=4096, backend=None):
+        """
+        encode_fn: blocking callable list[str] -> float32 array (n, dim)
+        backend: optional api.backends.Backend used to run encode_fn (limit + timeout); else the default executor
+        """
+        self.encode_fn = encode_fn
+        self.model_name = model_name
+        self.max_batch = int(max_batch)
+        self.window = float(window_ms) / 1000.0
+        self.cache_size = int(cache_size)
+        self.backend = backend
+        self._cache = OrderedDict()
+        self._pending = OrderedDict()  # key -> (text, future)
+        self._timer = None
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "batches": 0, "batched_texts": 0}
+
+    def _cache_get(self, key):
+        vec = self._cache.get(key)
+        if vec is not None:
+            self._cache.move_to_end(key)
+        return vec
+
+    def _cache_put(self, key, vec):
+        self._cache[key] = vec
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def embed(self, text: str) -> np.ndarray:
+        norm = normalize_text(text)
+        key = (self.model_name, norm)
+        vec = self._cache_get(key)
+        if vec is not None:
+            self.stats["hits"] += 1
+            return vec
+        self.stats["misses"] += 1
+        pending = self._pending.get(key)
+        if pending is not None:
+            # same text already queued in this window
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(pending[1])
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending[key] = (norm, fut)
+        if len(self._pending) >= self.max_batch:
+            self._flush_now()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush_now)
+        return await asyncio.shield(fut)
+
+    def _flush_now(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch = list(self._pending.items())
+        self._pending = OrderedDict()
+        asyncio.ensure_future(self._run_batch(batch))
+
+    async def _run_batch(self, batch):
+        texts = [text for _, (text, _) in batch]
+        try:
+            if self.backend is not None:
+                vecs = await self.backend.run_sync(self.encode_fn, texts)
+            else:
+                vecs = await asyncio.get_running_loop().run_in_executor(None, self.encode_fn, texts)
+        except Exception as e:
+            for _, (_, fut) in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        self.stats["batches"] += 1
+        self.stats["batched_texts"] += len(texts)
+        vecs = np.asarray(vecs, dtype=np.float32)
+        for (key, (_, fut)), vec in zip(batch, vecs):
+            vec = vec.copy()
+            vec.flags.writeable = False  # shared between cache and callers
+            self._cache_put(key, vec)
+            if not fut.done():
+                fut.set_result(vec)
+
+    def snapshot(self):
+        s = dict(self.stats)
+        lookups = s["hits"] + s["misses"]
+        s["hit_ratio"] = round(s["hits"] / lookups, 4) if lookups else 0.0
+        s["avg_batch"] = round(s["batched_texts"] / s["batches"], 2) if s["batches"] else 0.0
+        s["cache_entries"] = len(self._cache)
+        s["cache_size"] = self.cache_size
+        return s
@@ -0,0 +1,98 @@
+"""
+api/faiss_client.py
+- Local ANN search over the per-case FAISS indexes built by workers/faiss_indexer.py
+  (/data/cases/<case_id>/parsed/faiss/index.faiss + ids.json); no Milvus needed.
+- Indexes are opened memory-mapped (IO_FLAG_MMAP, read-only) where the index type supports it.
+- Open indexes live in an LRU bounded by a byte budget (sum of index file sizes); a changed index file
+  mtime (rebuild) drops the cached handle.
+"""
+import os, json, threading
+from collections import OrderedDict
+
+class FaissSearcher:
+    def __init__(self, cases_root="/data/cases", max_bytes=2 << 30, ef=64, nprobe=16):
+        self.cases_root = cases_root
+        self.max_bytes = int(max_bytes)
+        self.ef = int(ef)
+        self.nprobe = int(nprobe)
+        self._cache = OrderedDict()  # case_id -> {"index", "ids", "mtime", "bytes"}
+        self._lock = threading.Lock()
+        self.stats_counters = {"loads": 0, "evictions": 0, "searches": 0}
+
+    def _paths(self, case_id):
+        d = os.path.join(self.cases_root, case_id, "parsed", "faiss")
+        return os.path.join(d, "index.faiss"), os.path.join(d, "ids.json")
+
+    def _load(self, case_id, index_path, ids_path, mtime):
+        import faiss
+        try:
+            index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except Exception:
+            # index type without mmap support
+            index = faiss.read_index(index_path)
+        with open(ids_path, "r", encoding="utf-8") as f:
+            ids = json.load(f)["chunk_ids"]
+        self.stats_counters["loads"] += 1
+        return {"index": index, "ids": ids, "mtime": mtime, "bytes": os.path.getsize(index_path)}
+
+    def get(self, case_id):
+        """
+        Cached entry for the case's index, or None if the case has no FAISS index.
+        """
+        index_path, ids_path = self._paths(case_id)
+        try:
+            mtime = os.stat(index_path).st_mtime_ns
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._cache.get(case_id)
+            if entry and entry["mtime"] == mtime:
+                self._cache.move_to_end(case_id)
+                return entry
+        entry = self._load(case_id, index_path, ids_path, mtime)
+        with self._lock:
+            self._cache[case_id] = entry
+            self._cache.move_to_end(case_id)
+            total = sum(e["bytes"] for e in self._cache.values())
+            # evict least recently used, but always keep the one just loaded
+            while total > self.max_bytes and len(self._cache) > 1:
+                _, old = self._cache.popitem(last=False)
+                total -= old["bytes"]
+                self.stats_counters["evictions"] += 1
+        return entry
+
+    def _params(self, index, limit, ef):
+        import faiss
+        ef = max(int(ef or self.ef), limit)
+        try:
+            if hasattr(index, "hnsw"):
+                return faiss.SearchParametersHNSW(efSearch=ef)
+            if hasattr(index, "nprobe"):
+                return faiss.SearchParametersIVF(nprobe=self.nprobe)
+        except AttributeError:
+            # faiss < 1.7.3: per-call parameters unavailable, use the index defaults
+            pass
+        return None
+
+    def search(self, case_id, vec, limit=50, ef=None):
+        """
+        ANN search for one query vector. Returns [{"chunk_id", "score"}] or None if the case has no index.
+        """
+        import numpy as np
+        entry = self.get(case_id)
+        if entry is None:
+            return None
+        index, ids = entry["index"], entry["ids"]
+        limit = min(int(limit), index.ntotal)
+        if limit <= 0:
+            return []
+        q = np.asarray(vec, dtype=np.float32).reshape(1, -1)
+        params = self._params(index, limit, ef)
+        scores, rows = index.search(q, limit, params=params) if params is not None else index.search(q, limit)
+        self.stats_counters["searches"] += 1
+        return [{"chunk_id": ids[r], "score": float(s)} for s, r in zip(scores[0], rows[0]) if 0 <= r < len(ids)]
+
+    def stats(self):
+        with self._lock:
+            return {"loaded": list(self._cache), "bytes": sum(e["bytes"] for e in self._cache.values()),
+                    "max_bytes": self.max_bytes, **self.stats_counters}
@@ -0,0 +1,144 @@
+"""
+api/law_index.py
+- In-memory, time-anchored law article retrieval for /qa/ask.
+- All article embeddings (law_article_embeddings, filled by workers/law_embedder.py) are held as one contiguous
+  float32 (or float16) matrix with per-row effective_from / effective_to day ordinals from the laws table.
+- A query is scored against every article with one matrix-vector product; articles not in force on the time
+  anchor (effective_from <= anchor < effective_to, open ends allowed) are masked out before top-k.
+- Only embeddings made with the API's query model are loaded (law_article_embeddings.model), so a corpus
+  embedded with another model never mixes vector spaces with the query.
+- The corpus is shared by all cases: loaded once per process, and reloaded when the laws or their embeddings
+  change (checked at most every reload_interval seconds).
+"""
+import json, time, threading
+from datetime import date
+import numpy as np
+
+_NO_START = np.iinfo(np.int32).min
+_NO_END = np.iinfo(np.int32).max
+
+def parse_anchor(value):
+    """
+    "YYYY-MM-DD" (or "YYYY-MM", "YYYY") -> date; None -> today. Raises ValueError on anything else.
+    """
+    if value is None or str(value).strip() == "":
+        return date.today()
+    parts = [int(p) for p in str(value).strip()[:10].split("-")]
+    parts += [1] * (3 - len(parts))
+    return date(*parts[:3])
+
+class LawIndex:
+    VERSION_SQL = """SELECT (SELECT count(*) || ':' || coalesce(max(updated_at)::text, '') FROM law_article_embeddings
+                             WHERE model = %s)
+                            || '|' ||
+                            (SELECT count(*) || ':' || coalesce(md5(string_agg(law_id || ',' || coalesce(effective_from::text, '')
+                                                                  || ',' || coalesce(effective_to::text, ''), ';' ORDER BY law_id)), '')
+                             FROM laws)"""
+    LOAD_SQL = """SELECT a.id, l.law_id, l.title, a.article_no, a.text, a.version_id, l.effective_from, l.effective_to, e.vector
+                  FROM law_articles a
+                  JOIN laws l ON l.law_id = a.law_id
+                  JOIN law_article_embeddings e ON e.article_id = a.id
+                  WHERE e.model = %s
+                  ORDER BY a.id"""
+
+    def __init__(self, conn_factory, model: str, dtype: str="float32", reload_interval: float=60.0, enabled: bool=True):
+        """
+        conn_factory: context manager yielding a psycopg2 connection (api.main.sql_conn)
+        model: embedding model of the query vectors; rows embedded with any other model are ignored
+        """
+        self.conn_factory = conn_factory
+        self.model = model
+        self.dtype = np.dtype(dtype)
+        self.reload_interval = float(reload_interval)
+        self.enabled = enabled
+        self._state = None  # (matrix, eff_from, eff_to, articles, version)
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"loads": 0, "searches": 0}
+
+    def _version(self):
+        with self.conn_factory() as con, con.cursor() as cur:
+            cur.execute(self.VERSION_SQL, (self.model,))
+            return cur.fetchone()[0]
+
+    def _load(self, version):
+        with self.conn_factory() as con, con.cursor() as cur:
+            cur.execute(self.LOAD_SQL, (self.model,))
+            rows = cur.fetchall()
+        if not rows:
+            print(f"[warn] law index: no article embeddings for model {self.model} (run workers/law_embedder.py)")
+            return (None, None, None, [], version)
+        articles, vecs = [], []
+        eff_from = np.empty(len(rows), dtype=np.int32)
+        eff_to = np.empty(len(rows), dtype=np.int32)
+        for i, (aid, law_id, title, article_no, text, version_id, d_from, d_to, vec) in enumerate(rows):
+            articles.append({"article_id": aid, "law_id": law_id, "title": title, "article_no": article_no,
+                             "text": text, "version_id": version_id,
+                             "effective_from": d_from.isoformat() if d_from else None,
+                             "effective_to": d_to.isoformat() if d_to else None})
+            eff_from[i] = d_from.toordinal() if d_from else _NO_START
+            eff_to[i] = d_to.toordinal() if d_to else _NO_END
+            vecs.append(json.loads(vec) if isinstance(vec, str) else vec)
+        matrix = np.ascontiguousarray(np.asarray(vecs, dtype=np.float32).astype(self.dtype, copy=False))
+        self.stats["loads"] += 1
+        print(f"[i] law index loaded: {len(articles)} articles, {matrix.nbytes >> 20} MiB ({self.dtype})")
+        return (matrix, eff_from, eff_to, articles, version)
+
+    def refresh(self, force: bool=False):
+        """
+        Reload if the law corpus changed; cheap version probe at most every reload_interval seconds.
+        """
+        now = time.monotonic()
+        if not force and self._state is not None and now - self._checked < self.reload_interval:
+            return self._state
+        with self._lock:
+            if not force and self._state is not None and now - self._checked < self.reload_interval:
+                return self._state
+            self._checked = now
+            version = self._version()
+            if force or self._state is None or self._state[4] != version:
+                self._state = self._load(version)
+        return self._state
+
+    def search(self, qvec, anchor=None, k: int=5, min_score: float=None):
+        """
+        Top-k articles in force on the anchor date: [{article fields..., "score"}], best first.
+        """
+        if not self.enabled or k <= 0:
+            return []
+        matrix, eff_from, eff_to, articles, _ = self.refresh()
+        if matrix is None:
+            return []
+        day = parse_anchor(anchor).toordinal()
+        q = np.asarray(qvec, dtype=np.float32)
+        if matrix.dtype == np.float32:
+            scores = matrix @ q
+        else:
+            # float16 storage: upcast in blocks, numpy has no fast half-precision GEMV
+            scores = np.empty(len(matrix), dtype=np.float32)
+            for start in range(0, len(matrix), 16384):
+                scores[start:start + 16384] = matrix[start:start + 16384].astype(np.float32) @ q
+        scores[(eff_from > day) | (eff_to <= day)] = -np.inf
+        k = min(int(k), len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        self.stats["searches"] += 1
+        out = []
+        for i in top:
+            s = float(scores[i])
+            if not np.isfinite(s) or (min_score is not None and s < min_score):
+                continue
+            out.append({**articles[i], "score": s})
+        return out
+
+    @property
+    def version(self):
+        st = self._state
+        return st[4] if st else None
+
+    def snapshot(self):
+        st = self._state
+        s = dict(self.stats)
+        s.update(enabled=self.enabled, model=self.model, articles=len(st[3]) if st else 0, dtype=str(self.dtype),
+                 bytes=int(st[0].nbytes) if st and st[0] is not None else 0)
+        return s
@@ -0,0 +1,164 @@
+"""
+api/milvus_client.py
+- Long-lived Milvus client for the API: one connection per process, opened at startup.
+- Keeps an LRU of loaded per-case Collection handles; collections idle for too long are released
+  so query-node memory stays bounded.
+- layout "shared": one collection (<prefix>) with case_id as partition key; searches filter on case_id and the
+  collection is never dropped, so re-indexing a case leaves no window without an ANN index. It serves every
+  case (and other API replicas), so eviction only drops the local handle and never releases it server-side.
+- layout "per_case": one collection per case (<prefix>_<case_id>); workers/milvus_indexer.py touches
+  /data/cases/<case_id>/parsed/milvus_stamp.json after a rebuild and a changed stamp drops the cached handle
+  so the next search reloads the new collection.
+"""
+import os, json, time, threading
+from collections import OrderedDict
+
+STAMP_NAME = "milvus_stamp.json"
+
+class MilvusSearcher:
+    def __init__(self, host="milvus", port="19530", coll_prefix="legal_chunks", max_loaded=16,
+                 idle_seconds=900, cases_root="/data/cases", alias="legal_api", layout="shared", ef=64):
+        if layout not in ("shared", "per_case"):
+            raise ValueError(f"unknown milvus layout: {layout}")
+        self.layout = layout
+        self.ef = int(ef)
+        self.host = host
+        self.port = str(port)
+        self.coll_prefix = coll_prefix
+        self.max_loaded = int(max_loaded)
+        self.idle_seconds = float(idle_seconds)
+        self.cases_root = cases_root
+        self.alias = alias
+        self._cache = OrderedDict()  # coll_name -> {"coll", "stamp", "last_used"}
+        self._lock = threading.Lock()
+        self._connected = False
+        self._sweeper = None
+        self._stop = threading.Event()
+
+    def connect(self):
+        from pymilvus import connections
+        connections.connect(alias=self.alias, host=self.host, port=self.port)
+        self._connected = True
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            names = list(self._cache)
+        for name in names:
+            self._evict(name)
+        if self._connected:
+            from pymilvus import connections
+            connections.disconnect(self.alias)
+            self._connected = False
+
+    def collection_name(self, case_id):
+        if self.layout == "shared":
+            return self.coll_prefix
+        return f"{self.coll_prefix}_{case_id}"
+
+    def _stamp(self, case_id):
+        if self.layout == "shared":
+            # upserts go into the live collection; the handle never goes stale
+            return None
+        try:
+            return os.stat(os.path.join(self.cases_root, case_id, "parsed", STAMP_NAME)).st_mtime_ns
+        except OSError:
+            return None
+
+    def _evict(self, name, release=True):
+        with self._lock:
+            entry = self._cache.pop(name, None)
+        # the shared collection stays loaded for everyone else; only per-case collections are released
+        if entry and release and self.layout == "per_case":
+            try:
+                entry["coll"].release()
+            except Exception as e:
+                print(f"[warn] milvus release {name} failed:", e)
+
+    def invalidate(self, case_id):
+        self._evict(self.collection_name(case_id), release=False)
+
+    def get_collection(self, case_id):
+        """
+        Return a loaded Collection for the case, or None if it does not exist.
+        """
+        if not self._connected:
+            self.connect()
+        name = self.collection_name(case_id)
+        stamp = self._stamp(case_id)
+        with self._lock:
+            entry = self._cache.get(name)
+            if entry and entry["stamp"] == stamp:
+                entry["last_used"] = time.monotonic()
+                self._cache.move_to_end(name)
+                return entry["coll"]
+        if entry:
+            # collection was rebuilt by the indexer; the old handle is stale
+            self._evict(name, release=False)
+        from pymilvus import Collection, utility
+        if not utility.has_collection(name, using=self.alias):
+            return None
+        coll = Collection(name, using=self.alias)
+        coll.load()
+        with self._lock:
+            self._cache[name] = {"coll": coll, "stamp": stamp, "last_used": time.monotonic()}
+            self._cache.move_to_end(name)
+            overflow = list(self._cache)[:max(0, len(self._cache) - self.max_loaded)]
+        for old in overflow:
+            self._evict(old)
+        return coll
+
+    def search(self, case_id, vec, limit=50, ef=None):
+        """
+        ANN search for one query vector. Returns [{"chunk_id", "score"}] or None if the case has no collection.
+        """
+        limit = int(limit)
+        # HNSW requires ef >= limit
+        search_params = {"metric_type": "IP", "params": {"ef": max(int(ef or self.ef), limit)}}
+        # partition-key filter: only the case's partition is searched
+        expr = f"case_id == {json.dumps(case_id)}" if self.layout == "shared" else None
+        for attempt in range(2):
+            coll = self.get_collection(case_id)
+            if coll is None:
+                return None
+            try:
+                results = coll.search([list(map(float, vec))], "embedding", param=search_params,
+                                      limit=limit, expr=expr, output_fields=["chunk_id"])
+                break
+            except Exception:
+                # released by another worker or dropped under us: reload once
+                self.invalidate(case_id)
+                if attempt:
+                    raise
+        hits = []
+        for res in results[0]:
+            try:
+                chunk_id = res.entity.get("chunk_id")
+            except Exception:
+                chunk_id = str(res.id)
+            hits.append({"chunk_id": chunk_id, "score": float(res.distance)})
+        return hits
+
+    def release_idle(self):
+        now = time.monotonic()
+        with self._lock:
+            idle = [n for n, e in self._cache.items() if now - e["last_used"] > self.idle_seconds]
+        for name in idle:
+            self._evict(name)
+        return idle
+
+    def start_sweeper(self, interval=60):
+        if self._sweeper is not None:
+            return
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.release_idle()
+                except Exception as e:
+                    print("[warn] milvus idle sweep failed:", e)
+        self._sweeper = threading.Thread(target=loop, name="milvus-idle-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stats(self):
+        with self._lock:
+            return {"layout": self.layout, "loaded": list(self._cache), "max_loaded": self.max_loaded, "idle_seconds": self.idle_seconds}
@@ -1,6 +1,31 @@
 # api/tasks/celery_app.py
+# One queue per pipeline stage so each gets its own worker pool, concurrency and prefetch (see docker-compose.yml):
+#   ocr    - parsing / PaddleOCR      (CPU heavy, long tasks)
+#   asr    - faster-whisper           (CPU heavy, very long tasks)
+#   index  - embedding + DB/ANN index (bge-large-zh, memory heavy)
+#   render - docx rendering           (light)
+# Workers keep their models warm for the life of the process: WARM_MODELS=ocr,asr,embed selects what each
+# worker pool loads at start (api/tasks/tasks.py).
 from celery import Celery
+from kombu import Queue
 import os
 redis_url = os.environ.get("REDIS_URL", "redis://redis:6379/0")
-cel = Celery("legal_tasks", broker=redis_url, backend=redis_url)
+cel = Celery("legal_tasks", broker=redis_url, backend=redis_url, include=["tasks.tasks"])
 cel.conf.update(task_serializer='json', result_serializer='json', accept_content=['json'])
+cel.conf.update(
+    task_queues=[Queue("ocr"), Queue("asr"), Queue("index"), Queue("render")],
+    task_default_queue="index",
+    task_routes={
+        "legal.run_parse": {"queue": "ocr"},
+        "legal.run_asr": {"queue": "asr"},
+        "legal.run_index": {"queue": "index"},
+        "legal.run_docgen": {"queue": "render"},
+    },
+    # long CPU-bound tasks: take one at a time, ack on completion so a killed worker's task is redelivered
+    worker_prefetch_multiplier=int(os.environ.get("CELERY_PREFETCH", 1)),
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    task_track_started=True,
+    result_extended=True,
+    broker_transport_options={"visibility_timeout": int(os.environ.get("CELERY_VISIBILITY_TIMEOUT", 6 * 3600))},
+)
@@ -1,31 +1,110 @@
 # api/tasks/tasks.py
+# Pipeline tasks run the workers in-process (no interpreter start per task) on warm models:
+# worker_process_init loads what WARM_MODELS asks for once per worker process, and the worker modules reuse it
+# (ocr_parse.warm_ocr, asr_transcribe.warm_model, embed_pool.keep_resident).
+# Task state is real: a non-zero worker exit or an exception is a FAILURE, transient DB / connection errors
+# are retried with backoff, and the workers' "[i]"/"[ok]" log lines are published as PROGRESS meta for
+# GET /tasks/{task_id}.
+# Celery's prefork children are daemonic and may not start process pools, so the tasks always run the workers
+# with workers=1 on the in-process model (loaded on first use if WARM_MODELS did not preload it); scale a stage
+# with the queue's --concurrency instead of OCR_WORKERS / ASR_WORKERS / EMBED_WORKERS.
 from .celery_app import cel
-import os, subprocess, json
+from celery.signals import worker_process_init
+import os, sys, time, contextlib
 
-@cel.task(bind=True)
+WORKERS_DIR = os.environ.get("WORKERS_DIR") or next(
+    (d for d in (os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "workers"),
+                 os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "workers")) if os.path.isdir(d)),
+    "/app/workers")
+if WORKERS_DIR not in sys.path:
+    sys.path.insert(0, WORKERS_DIR)
+
+EMBED_MODEL = os.environ.get("EMBED_MODEL", "BAAI/bge-large-zh")
+RETRY = dict(autoretry_for=(ConnectionError, TimeoutError), retry_backoff=True, retry_backoff_max=600,
+             retry_jitter=True, max_retries=int(os.environ.get("TASK_MAX_RETRIES", 3)))
+try:
+    import psycopg2
+    RETRY["autoretry_for"] += (psycopg2.OperationalError,)
+except ImportError:
+    pass
+
+@worker_process_init.connect
+def warm_models(**_):
+    warm = {m.strip() for m in os.environ.get("WARM_MODELS", "").split(",") if m.strip()}
+    t0 = time.monotonic()
+    if "ocr" in warm:
+        import ocr_parse
+        ocr_parse.warm_ocr(os.environ.get("OCR_THREADS"))
+    if "asr" in warm:
+        import asr_transcribe
+        asr_transcribe.warm_model(os.environ.get("ASR_MODEL", "medium"), os.environ.get("ASR_COMPUTE_TYPE", "int8"),
+                                  os.environ.get("ASR_THREADS"))
+    if "embed" in warm:
+        import embed_pool
+        embed_pool.keep_resident(EMBED_MODEL)
+    if warm:
+        print(f"[ok] warm models {sorted(warm)} loaded in {time.monotonic() - t0:.1f}s")
+
+class _Progress:
+    """
+    stdout tee: forwards worker output and publishes the latest status line as PROGRESS meta.
+    """
+    def __init__(self, task, stage, out):
+        self.task, self.stage, self.out = task, stage, out
+        self.t0 = time.monotonic()
+        self.lines = []
+        self._buf = ""
+
+    def write(self, s):
+        self.out.write(s)
+        self._buf += s
+        while "\n" in self._buf:
+            line, self._buf = self._buf.split("\n", 1)
+            if line.startswith(("[i]", "[ok]", "[warn]", "[!]")):
+                self.lines = (self.lines + [line])[-20:]
+                self.task.update_state(state="PROGRESS", meta=self.meta())
+        return len(s)
+
+    def flush(self):
+        self.out.flush()
+
+    def meta(self):
+        return {"stage": self.stage, "message": self.lines[-1] if self.lines else None, "log": self.lines,
+                "elapsed": round(time.monotonic() - self.t0, 1)}
+
+def _run(task, stage, fn, *args, **kwargs):
+    progress = _Progress(task, stage, sys.stdout)
+    task.update_state(state="PROGRESS", meta=progress.meta())
+    with contextlib.redirect_stdout(progress):
+        rc = fn(*args, **kwargs)
+    if rc:
+        raise RuntimeError(f"{stage} exited with status {rc}: {progress.meta()['message']}")
+    return {"status": "ok", **progress.meta()}
+
+@cel.task(bind=True, name="legal.run_parse", **RETRY)
 def run_parse(self, case_id):
-    try:
-        cmd = ["python", "/app/../workers/ocr_parse.py", case_id]
-        res = subprocess.run(cmd, check=True, capture_output=True, text=True)
-        return {"status":"ok", "out": res.stdout}
-    except subprocess.CalledProcessError as e:
-        return {"status":"error", "err": e.stderr}
-
-@cel.task(bind=True)
+    import ocr_parse
+    ocr_parse.warm_ocr(os.environ.get("OCR_THREADS"))
+    return _run(self, "parse", ocr_parse.main, case_id, workers=1)
+
+@cel.task(bind=True, name="legal.run_asr", **RETRY)
+def run_asr(self, case_id):
+    import asr_transcribe
+    model_size, compute_type = os.environ.get("ASR_MODEL", "medium"), os.environ.get("ASR_COMPUTE_TYPE", "int8")
+    # with a warm in-process model and workers=1, main() transcribes without a process pool
+    asr_transcribe.warm_model(model_size, compute_type, os.environ.get("ASR_THREADS"))
+    return _run(self, "asr", asr_transcribe.main, case_id, workers=1, model_size=model_size, compute_type=compute_type)
+
+@cel.task(bind=True, name="legal.run_index", **RETRY)
 def run_index(self, case_id, db_url):
-    try:
-        cmd = ["python", "/app/../workers/index_builder.py", case_id, db_url]
-        res = subprocess.run(cmd, check=True, capture_output=True, text=True)
-        return {"status":"ok", "out": res.stdout}
-    except subprocess.CalledProcessError as e:
-        return {"status":"error", "err": e.stderr}
-
-@cel.task(bind=True)
+    import index_builder, embed_pool
+    embed_pool.keep_resident(EMBED_MODEL)
+    return _run(self, "index", index_builder.main, case_id, db_url, EMBED_MODEL, incremental=True, workers=1)
+
+@cel.task(bind=True, name="legal.run_docgen", **RETRY)
 def run_docgen(self, case_id, doc_type, version, fields_json_path):
-    try:
-        out_path = f"/data/cases/{case_id}/{doc_type}-{version}.docx"
-        cmd = ["python", "/app/../workers/render_docx.py", doc_type, version, fields_json_path, out_path]
-        res = subprocess.run(cmd, check=True, capture_output=True, text=True)
-        return {"status":"ok", "out": res.stdout, "out_path": out_path}
-    except subprocess.CalledProcessError as e:
-        return {"status":"error", "err": e.stderr}
+    import render_docx
+    out_path = f"/data/cases/{case_id}/{doc_type}-{version}.docx"
+    res = _run(self, "docgen", render_docx.main, doc_type, version, fields_json_path, out_path)
+    res["out_path"] = out_path
+    return res
@@ -0,0 +1,16 @@
+-- Persistent answer cache for /qa/ask (api/answer_cache.py).
+-- cache_key = sha256(case_id, case generation, normalized question, ordered top chunk ids, model).
+CREATE TABLE IF NOT EXISTS qa_answer_cache (
+  cache_key TEXT PRIMARY KEY,
+  case_id TEXT NOT NULL,
+  case_generation TEXT,
+  question TEXT,
+  model TEXT,
+  chunk_ids TEXT[],
+  answer TEXT NOT NULL,
+  citations JSONB,
+  hits INT NOT NULL DEFAULT 0,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_qa_answer_cache_case ON qa_answer_cache(case_id);
@@ -0,0 +1,11 @@
+-- Content-addressed case assets for /ingest/case (api/asset_store.py).
+-- Blobs are stored once per sha256 under /data/blobs (optionally mirrored to the object store);
+-- each case references them by file name.
+ALTER TABLE case_assets ADD COLUMN IF NOT EXISTS filename TEXT;
+ALTER TABLE case_assets ADD COLUMN IF NOT EXISTS sha256 TEXT;
+ALTER TABLE case_assets ADD COLUMN IF NOT EXISTS size BIGINT;
+ALTER TABLE case_assets ADD COLUMN IF NOT EXISTS blob_uri TEXT;
+ALTER TABLE case_assets ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_case_assets_case_file ON case_assets(case_id, filename);
+CREATE INDEX IF NOT EXISTS idx_case_assets_sha256 ON case_assets(sha256);
@@ -0,0 +1,26 @@
+-- Case-scoped, Chinese-aware full-text search on chunks (workers/text_segment.py).
+-- case_id replaces filtering on source_id (which holds the asset file name).
+-- tsv is to_tsvector('simple', <segmented text>), written by workers/index_builder.py; rows indexed before
+-- this migration get it on their next index_builder run (they are treated as not yet indexed).
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS case_id TEXT;
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS tsv tsvector;
+
+UPDATE chunks SET case_id = meta->>'case_id' WHERE case_id IS NULL AND meta ? 'case_id';
+
+-- One-time cleanup of rows from the original indexer: random uuid4 chunk ids and no case in meta, so
+-- index_builder's content-addressed ids never match them and they were never removed.
+-- Rows whose asset (source_id = file name) belongs to exactly one case are attributed to that case; the case's
+-- next index_builder run then replaces them. Rows that cannot be attributed to any case are deleted.
+UPDATE chunks c SET case_id = a.case_id
+FROM (SELECT coalesce(filename, regexp_replace(path, '^.*/', '')) AS filename, min(case_id) AS case_id
+      FROM case_assets WHERE case_id IS NOT NULL
+      GROUP BY 1 HAVING count(DISTINCT case_id) = 1) a
+WHERE c.case_id IS NULL AND NOT c.meta ? 'case_id'
+  AND coalesce(c.source_id, c.meta->>'asset') = a.filename;
+DELETE FROM embeddings e USING chunks c WHERE e.chunk_id = c.chunk_id AND c.case_id IS NULL;
+DELETE FROM chunks WHERE case_id IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_chunks_case_id ON chunks(case_id);
+CREATE INDEX IF NOT EXISTS idx_chunks_tsv ON chunks USING GIN (tsv);
+-- the unsegmented expression index never matched Chinese queries
+DROP INDEX IF EXISTS idx_chunks_text;
@@ -0,0 +1,13 @@
+-- Postgres-native ANN path (api/main.py: pg_ann_search, ann.primary: pgvector).
+-- embeddings.case_id lets the HNSW scan be filtered to one case; written by workers/index_builder.py.
+-- Index build parameters are set here; re-create with different m / ef_construction via
+--   python scripts/pg_vector_index.py --m 16 --ef-construction 64
+-- ef_search is a per-query setting (ann.pgvector.ef_search in configs/app.yaml).
+ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS case_id TEXT;
+
+UPDATE embeddings e SET case_id = c.case_id FROM chunks c
+WHERE e.chunk_id = c.chunk_id AND e.case_id IS NULL AND c.case_id IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_embeddings_case_id ON embeddings(case_id);
+-- vectors are normalized, so inner product (<#>) ranks like cosine
+CREATE INDEX IF NOT EXISTS idx_embeddings_hnsw ON embeddings USING hnsw (vector vector_ip_ops) WITH (m = 16, ef_construction = 64);
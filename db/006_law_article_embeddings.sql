@@ -0,0 +1,9 @@
+-- Precomputed law article embeddings for time-anchored law retrieval (api/law_index.py).
+-- Filled by workers/law_embedder.py; text_sha256 detects edited articles, updated_at drives API hot-reload.
+CREATE TABLE IF NOT EXISTS law_article_embeddings (
+  article_id INT PRIMARY KEY REFERENCES law_articles(id) ON DELETE CASCADE,
+  model TEXT NOT NULL,
+  text_sha256 TEXT NOT NULL,
+  vector vector(1024) NOT NULL,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
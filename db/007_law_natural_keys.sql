@@ -0,0 +1,17 @@
+-- Natural keys for the idempotent law import (scripts/import_laws.py):
+--   laws: title; law_articles: (law_id, article_no, version_id).
+-- Collapses duplicates left by earlier non-idempotent imports before adding the unique indexes.
+UPDATE law_articles a SET law_id = k.keep
+FROM (SELECT law_id, min(law_id) OVER (PARTITION BY title) AS keep FROM laws) k
+WHERE a.law_id = k.law_id AND k.law_id <> k.keep;
+DELETE FROM laws l USING laws k WHERE l.title = k.title AND l.law_id > k.law_id;
+
+UPDATE law_articles SET article_no = '' WHERE article_no IS NULL;
+UPDATE law_articles SET version_id = '' WHERE version_id IS NULL;
+ALTER TABLE law_articles ALTER COLUMN article_no SET DEFAULT '';
+ALTER TABLE law_articles ALTER COLUMN version_id SET DEFAULT '';
+DELETE FROM law_articles a USING law_articles b
+WHERE a.law_id = b.law_id AND a.article_no = b.article_no AND a.version_id = b.version_id AND a.id > b.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_laws_title ON laws(title);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_law_articles_natural ON law_articles(law_id, article_no, version_id);
@@ -0,0 +1,4 @@
+-- Records which segmenter (workers/text_segment.py: jieba | bigram) produced chunks.tsv, so the query side can
+-- detect an index built with a different tokenization than its own.
+-- Rows indexed before this migration have NULL and are re-segmented on the next index_builder run.
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS tsv_segmenter TEXT;
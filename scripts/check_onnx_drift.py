@@ -0,0 +1,105 @@
+"""
+scripts/check_onnx_drift.py
+- Accuracy check for the ONNX/int8 inference backend (workers/onnx_backend.py) against the PyTorch path.
+- Embedder: per-text cosine between torch and onnx vectors, and top-k neighbour overlap per query.
+- Reranker: score MAE, Spearman rank correlation and top-k overlap per query.
+- Exits non-zero if any metric is outside the thresholds, so it can gate a backend switch.
+Usage:
+  python scripts/check_onnx_drift.py <chunks.jsonl> [queries.txt] [--embed-model M] [--rerank-model M] [--top-k 6] [--max-chunks 500]
+"""
+import sys, os, json, argparse
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "workers"))
+from onnx_backend import load_embedder, load_cross_encoder
+
+DEFAULT_QUERIES = ["本案争议焦点为何？", "被告人是否构成犯罪？", "案发时间和地点是什么？", "有哪些证人证言？", "证据是否确实充分？"]
+
+def load_texts(path, limit):
+    out = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            t = json.loads(line).get("text", "").strip()
+            if t:
+                out.append(t[:2000])
+            if len(out) >= limit:
+                break
+    return out
+
+def rankdata(x):
+    r = np.empty(len(x), dtype=np.float64)
+    r[np.argsort(x, kind="mergesort")] = np.arange(len(x))
+    return r
+
+def spearman(a, b):
+    if len(a) < 2:
+        return 1.0
+    ra, rb = rankdata(np.asarray(a)), rankdata(np.asarray(b))
+    return float(np.corrcoef(ra, rb)[0, 1])
+
+def topk_overlap(a, b, k):
+    k = min(k, len(a))
+    return len(set(np.argsort(-np.asarray(a))[:k]) & set(np.argsort(-np.asarray(b))[:k])) / max(k, 1)
+
+def check_embedder(model_name, texts, queries, top_k):
+    ref, cand = load_embedder(model_name, "torch"), load_embedder(model_name, "onnx")
+    e_ref = np.asarray(ref.encode(texts, normalize_embeddings=True), dtype=np.float32)
+    e_cand = np.asarray(cand.encode(texts, normalize_embeddings=True), dtype=np.float32)
+    cos = (e_ref * e_cand).sum(1)
+    q_ref = np.asarray(ref.encode(queries, normalize_embeddings=True), dtype=np.float32)
+    q_cand = np.asarray(cand.encode(queries, normalize_embeddings=True), dtype=np.float32)
+    overlaps = [topk_overlap(e_ref @ qr, e_cand @ qc, top_k) for qr, qc in zip(q_ref, q_cand)]
+    return {"cosine_min": float(cos.min()), "cosine_mean": float(cos.mean()), "cosine_p5": float(np.percentile(cos, 5)),
+            f"top{top_k}_overlap_mean": float(np.mean(overlaps))}
+
+def check_reranker(model_name, texts, queries, top_k):
+    ref, cand = load_cross_encoder(model_name, "torch"), load_cross_encoder(model_name, "onnx")
+    maes, rhos, overlaps = [], [], []
+    for q in queries:
+        pairs = [[q, t] for t in texts]
+        s_ref = np.asarray(ref.predict(pairs, batch_size=32), dtype=np.float32)
+        s_cand = np.asarray(cand.predict(pairs, batch_size=32), dtype=np.float32)
+        maes.append(float(np.abs(s_ref - s_cand).mean()))
+        rhos.append(spearman(s_ref, s_cand))
+        overlaps.append(topk_overlap(s_ref, s_cand, top_k))
+    return {"score_mae_mean": float(np.mean(maes)), "spearman_min": float(np.min(rhos)), "spearman_mean": float(np.mean(rhos)),
+            f"top{top_k}_overlap_mean": float(np.mean(overlaps))}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("chunks")
+    ap.add_argument("queries", nargs="?")
+    ap.add_argument("--embed-model", default="BAAI/bge-large-zh")
+    ap.add_argument("--rerank-model", default=os.environ.get("CROSS_ENCODER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"))
+    ap.add_argument("--top-k", type=int, default=6)
+    ap.add_argument("--max-chunks", type=int, default=500)
+    ap.add_argument("--min-cosine", type=float, default=0.98)
+    ap.add_argument("--min-spearman", type=float, default=0.95)
+    ap.add_argument("--min-overlap", type=float, default=0.8)
+    args = ap.parse_args()
+    texts = load_texts(args.chunks, args.max_chunks)
+    if not texts:
+        print("[!] no chunks in", args.chunks); return 1
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [l.strip() for l in f if l.strip()]
+    key = f"top{args.top_k}_overlap_mean"
+    report = {"chunks": len(texts), "queries": len(queries),
+              "embed": check_embedder(args.embed_model, texts, queries, args.top_k),
+              "rerank": check_reranker(args.rerank_model, texts, queries, args.top_k)}
+    failures = []
+    if report["embed"]["cosine_min"] < args.min_cosine:
+        failures.append("embed cosine_min")
+    if report["embed"][key] < args.min_overlap:
+        failures.append(f"embed {key}")
+    if report["rerank"]["spearman_min"] < args.min_spearman:
+        failures.append("rerank spearman_min")
+    if report["rerank"][key] < args.min_overlap:
+        failures.append(f"rerank {key}")
+    report["failures"] = failures
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    print("[ok] drift within thresholds" if not failures else f"[!] drift check failed: {', '.join(failures)}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
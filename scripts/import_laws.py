@@ -1,31 +1,198 @@
 """
 scripts/import_laws.py
 - Imports JSON law file (see data/laws/sample_laws.json) into Postgres laws and law_articles tables.
+- Streams the file: a top-level JSON array of laws (ijson when installed, else an incremental decoder) or
+  JSON Lines (one law per line), so memory stays flat for the full national corpus.
+- Bulk-loads batches with COPY into temp staging tables, then upserts on natural keys (db/007_law_natural_keys.sql):
+  laws by title, articles by (law, article_no, version_id). Unchanged rows are not rewritten, so re-runs are
+  idempotent and do not bloat the tables.
+- Fills effective dates and status: law-level effective_from / effective_to / status from the JSON; a missing
+  effective_to is taken from the next version of the same law (title without its trailing "(...)" edition),
+  and status is derived from the dates when not given.
+- --embed: afterwards embed only new or changed articles (workers/law_embedder.py).
 Usage:
-  python scripts/import_laws.py <DB_URL> <path_to_laws_json>
+  python scripts/import_laws.py <DB_URL> <path_to_laws_json> [--batch-size 5000] [--embed] [--model M]
+"""
+import sys, io, os, csv, json, time, argparse
+
+EMBED_MODEL = os.environ.get("EMBED_MODEL", "BAAI/bge-large-zh")
+
+STAGE_DDL = """
+CREATE TEMP TABLE IF NOT EXISTS stage_laws (
+  title TEXT, level TEXT, issuer TEXT, effective_from DATE, effective_to DATE, status TEXT
+) ON COMMIT DELETE ROWS;
+CREATE TEMP TABLE IF NOT EXISTS stage_articles (
+  title TEXT, article_no TEXT, paragraph_no TEXT, item_no TEXT, text TEXT, version_id TEXT
+) ON COMMIT DELETE ROWS;
+"""
+
+UPSERT_LAWS = """
+INSERT INTO laws(title, level, issuer, effective_from, effective_to, status)
+SELECT DISTINCT ON (title) title, level, issuer, effective_from, effective_to, status FROM stage_laws
+ON CONFLICT (title) DO UPDATE SET level=COALESCE(EXCLUDED.level, laws.level), issuer=COALESCE(EXCLUDED.issuer, laws.issuer),
+  effective_from=COALESCE(EXCLUDED.effective_from, laws.effective_from),
+  effective_to=COALESCE(EXCLUDED.effective_to, laws.effective_to), status=COALESCE(EXCLUDED.status, laws.status)
+WHERE (laws.level, laws.issuer, laws.effective_from, laws.effective_to, laws.status) IS DISTINCT FROM
+      (COALESCE(EXCLUDED.level, laws.level), COALESCE(EXCLUDED.issuer, laws.issuer),
+       COALESCE(EXCLUDED.effective_from, laws.effective_from), COALESCE(EXCLUDED.effective_to, laws.effective_to),
+       COALESCE(EXCLUDED.status, laws.status))
+RETURNING (xmax = 0)
+"""
+
+UPSERT_ARTICLES = """
+INSERT INTO law_articles(law_id, article_no, paragraph_no, item_no, text, version_id)
+SELECT DISTINCT ON (l.law_id, s.article_no, s.version_id) l.law_id, s.article_no, s.paragraph_no, s.item_no, s.text, s.version_id
+FROM stage_articles s JOIN laws l ON l.title = s.title
+ON CONFLICT (law_id, article_no, version_id) DO UPDATE SET text=EXCLUDED.text,
+  paragraph_no=EXCLUDED.paragraph_no, item_no=EXCLUDED.item_no
+WHERE (law_articles.text, law_articles.paragraph_no, law_articles.item_no) IS DISTINCT FROM
+      (EXCLUDED.text, EXCLUDED.paragraph_no, EXCLUDED.item_no)
+RETURNING (xmax = 0)
+"""
+
+# missing effective_to := effective_from of the next edition of the same law; then derive status
+FILL_DATES = r"""
+WITH v AS (
+  SELECT law_id, lead(effective_from) OVER (PARTITION BY regexp_replace(title, '\s*[（(][^（(]*[)）]\s*$', '')
+                                            ORDER BY effective_from) AS nxt
+  FROM laws WHERE effective_from IS NOT NULL
+)
+UPDATE laws l SET effective_to = v.nxt FROM v
+WHERE l.law_id = v.law_id AND l.effective_to IS NULL AND v.nxt IS NOT NULL;
+UPDATE laws SET status = d.status FROM (
+  SELECT law_id, CASE WHEN effective_to IS NOT NULL AND effective_to <= current_date THEN 'repealed'
+                      WHEN effective_from > current_date THEN 'pending' ELSE 'active' END AS status
+  FROM laws) d
+WHERE laws.law_id = d.law_id AND (laws.status IS NULL OR laws.status IN ('active', 'repealed', 'pending'))
+  AND laws.status IS DISTINCT FROM d.status;
 """
-import sys, json, psycopg2, os
 
 def conn(db_url):
+    import psycopg2
     return psycopg2.connect(db_url)
 
-def main(db_url, path):
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    con = conn(db_url); cur = con.cursor(); con.autocommit=True
-    for law in data:
-        cur.execute("INSERT INTO laws(title, level, issuer, effective_from, effective_to, status) VALUES (%s,%s,%s,%s,%s,%s) RETURNING law_id",
-                    (law.get("title"), None, None, None, None, "active"))
-        law_id = cur.fetchone()[0]
-        for art in law.get("articles",[]):
-            cur.execute("INSERT INTO law_articles(law_id, article_no, paragraph_no, item_no, text, version_id) VALUES (%s,%s,%s,%s,%s,%s)",
-                        (law_id, art.get("article_no"), None, None, art.get("text"), art.get("version_id")))
-    cur.close(); con.close()
-    print("[ok] imported", len(data))
+def iter_json_array(f, bufsize=1 << 20):
+    """
+    Incrementally decode the elements of a top-level JSON array without loading the whole file.
+    """
+    dec = json.JSONDecoder()
+    buf, pos, started = "", 0, False
+    while True:
+        chunk = f.read(bufsize)
+        buf = buf[pos:] + chunk
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buf):
+                break  # buffer used up: read more
+            if not started:
+                if buf[pos] != "[":
+                    raise ValueError("expected a JSON array of laws")
+                started, pos = True, pos + 1
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                obj, end = dec.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise
+                break  # element continues in the next chunk
+            yield obj
+            pos = end
+        if not chunk:
+            # EOF before the array was opened (empty / whitespace-only file) or closed (truncated file)
+            raise ValueError("expected a JSON array of laws" if not started else "unterminated JSON array of laws")
+
+def iter_laws(path):
+    if path.endswith((".jsonl", ".ndjson")):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+    try:
+        import ijson
+    except ImportError:
+        ijson = None
+    if ijson is not None:
+        with open(path, "rb") as f:
+            yield from ijson.items(f, "item")
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            yield from iter_json_array(f)
+
+def _csv_buffer(rows):
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    buf.seek(0)
+    return buf
+
+def _s(v):
+    # csv: None -> empty unquoted field -> NULL
+    return None if v is None or v == "" else str(v)
+
+def load_batch(cur, laws, stats):
+    law_rows, art_rows = [], []
+    for law in laws:
+        title = (law.get("title") or "").strip()
+        if not title:
+            continue
+        law_rows.append((title, _s(law.get("level")), _s(law.get("issuer")), _s(law.get("effective_from")),
+                         _s(law.get("effective_to")), _s(law.get("status"))))
+        for art in law.get("articles", []):
+            art_rows.append((title, str(art.get("article_no") or ""), _s(art.get("paragraph_no")),
+                             _s(art.get("item_no")), art.get("text") or "", str(art.get("version_id") or "")))
+    cur.copy_expert("COPY stage_laws FROM STDIN WITH (FORMAT csv)", _csv_buffer(law_rows))
+    # natural-key columns use '' rather than NULL (db/007), so empty fields must not load as NULL
+    cur.copy_expert("COPY stage_articles FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (article_no, text, version_id))",
+                    _csv_buffer(art_rows))
+    cur.execute(UPSERT_LAWS)
+    res = [r[0] for r in cur.fetchall()]
+    stats["laws"] += len(law_rows); stats["laws_new"] += sum(res); stats["laws_updated"] += len(res) - sum(res)
+    cur.execute(UPSERT_ARTICLES)
+    res = [r[0] for r in cur.fetchall()]
+    stats["articles"] += len(art_rows); stats["articles_new"] += sum(res); stats["articles_updated"] += len(res) - sum(res)
+
+def main(db_url, path, batch_size=5000, embed=False, model_name=EMBED_MODEL):
+    con = conn(db_url); cur = con.cursor()
+    cur.execute(STAGE_DDL)
+    stats = dict.fromkeys(("laws", "laws_new", "laws_updated", "articles", "articles_new", "articles_updated"), 0)
+    t0 = time.monotonic()
+    batch, n_articles = [], 0
+    try:
+        for law in iter_laws(path):
+            batch.append(law)
+            n_articles += len(law.get("articles", []))
+            # batches are bounded by article count; one transaction per batch
+            if n_articles >= batch_size:
+                load_batch(cur, batch, stats); con.commit()
+                batch, n_articles = [], 0
+                print(f"[i] {stats['articles']} articles, {stats['articles'] / (time.monotonic() - t0):.0f}/s")
+        if batch:
+            load_batch(cur, batch, stats); con.commit()
+        cur.execute(FILL_DATES); con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        cur.close(); con.close()
+    print(f"[ok] imported {stats['laws']} laws ({stats['laws_new']} new, {stats['laws_updated']} updated), "
+          f"{stats['articles']} articles ({stats['articles_new']} new, {stats['articles_updated']} updated) "
+          f"in {time.monotonic() - t0:.1f}s")
+    if embed:
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "workers"))
+        from law_embedder import main as embed_laws
+        return embed_laws(db_url, model_name, workers=int(os.environ.get("EMBED_WORKERS", 1)))
     return 0
 
 if __name__ == "__main__":
-    if len(sys.argv)<3:
-        print("Usage: python scripts/import_laws.py <DB_URL> <path_to_laws_json>")
-        sys.exit(1)
-    sys.exit(main(sys.argv[1], sys.argv[2]))
+    ap = argparse.ArgumentParser(description="Idempotent bulk import of the law corpus")
+    ap.add_argument("db_url")
+    ap.add_argument("path")
+    ap.add_argument("--batch-size", type=int, default=5000, help="articles per COPY batch / transaction")
+    ap.add_argument("--embed", action="store_true", help="embed new or changed articles afterwards")
+    ap.add_argument("--model", default=EMBED_MODEL)
+    args = ap.parse_args()
+    sys.exit(main(args.db_url, args.path, args.batch_size, args.embed, args.model))
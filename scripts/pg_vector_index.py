@@ -0,0 +1,40 @@
+"""
+scripts/pg_vector_index.py
+- (Re)build the pgvector ANN index on embeddings.vector with chosen parameters (see db/005_embeddings_hnsw.sql).
+- HNSW (m, ef_construction) by default, or IVFFlat (lists); built CONCURRENTLY under a temporary name and
+  swapped in, so searches keep an index during the rebuild.
+Usage:
+  python scripts/pg_vector_index.py <DB_URL> [--m 16] [--ef-construction 64] [--ivfflat --lists 1000] [--maintenance-mem 2GB]
+"""
+import sys, argparse, time, psycopg2
+
+INDEX_NAME = "idx_embeddings_hnsw"
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("db_url")
+    ap.add_argument("--m", type=int, default=16)
+    ap.add_argument("--ef-construction", type=int, default=64)
+    ap.add_argument("--ivfflat", action="store_true", help="IVFFlat instead of HNSW")
+    ap.add_argument("--lists", type=int, default=1000)
+    ap.add_argument("--maintenance-mem", default="2GB", help="maintenance_work_mem for the build")
+    args = ap.parse_args()
+    if args.ivfflat:
+        using = f"ivfflat (vector vector_ip_ops) WITH (lists = {int(args.lists)})"
+    else:
+        using = f"hnsw (vector vector_ip_ops) WITH (m = {int(args.m)}, ef_construction = {int(args.ef_construction)})"
+    con = psycopg2.connect(args.db_url)
+    con.autocommit = True  # CREATE INDEX CONCURRENTLY cannot run in a transaction
+    cur = con.cursor()
+    cur.execute("SET maintenance_work_mem = %s", (args.maintenance_mem,))
+    t0 = time.monotonic()
+    cur.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}_new")
+    cur.execute(f"CREATE INDEX CONCURRENTLY {INDEX_NAME}_new ON embeddings USING {using}")
+    cur.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
+    cur.execute(f"ALTER INDEX {INDEX_NAME}_new RENAME TO {INDEX_NAME}")
+    cur.close(); con.close()
+    print(f"[ok] {INDEX_NAME}: {using} in {time.monotonic() - t0:.1f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,32 @@
+import io, os, sys, json
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from import_laws import iter_json_array
+
+SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "laws", "sample_laws.json")
+
+@pytest.mark.parametrize("text", ["", "   ", "\n\t \r\n"])
+def test_empty_or_whitespace_input_raises(text):
+    with pytest.raises(ValueError, match="expected a JSON array"):
+        list(iter_json_array(io.StringIO(text)))
+
+def test_leading_whitespace_longer_than_buffer():
+    assert list(iter_json_array(io.StringIO(" " * 50 + '[{"a": 1}, {"b": 2}]'), bufsize=8)) == [{"a": 1}, {"b": 2}]
+
+def test_not_an_array_raises():
+    with pytest.raises(ValueError, match="expected a JSON array"):
+        list(iter_json_array(io.StringIO('{"title": "x"}')))
+
+def test_truncated_array_raises():
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO('[{"a": 1}, '), bufsize=4))
+
+def test_empty_array():
+    assert list(iter_json_array(io.StringIO(" [ ] "))) == []
+
+def test_matches_json_load_with_small_buffer():
+    with open(SAMPLE, "r", encoding="utf-8") as f:
+        expected = json.load(f)
+    with open(SAMPLE, "r", encoding="utf-8") as f:
+        assert list(iter_json_array(f, bufsize=7)) == expected
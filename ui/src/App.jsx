@@ -5,18 +5,67 @@ export default function App(){
   const [question, setQuestion] = useState("本案争议焦点为何？");
   const [answer, setAnswer] = useState(null);
   const [chunks, setChunks] = useState([]);
+  const [timings, setTimings] = useState(null);
   const [assets, setAssets] = useState([]);
   const [selectedAsset, setSelectedAsset] = useState(null);
 
   async function ask(){
     setAnswer("检索中...");
-    const resp = await fetch("/qa/ask", {
-      method: "POST", headers: {"Content-Type":"application/json"},
-      body: JSON.stringify({case_id: caseId, question: question})
-    });
-    const j = await resp.json();
-    setAnswer(j.answer);
-    setChunks(j.citations || []);
+    setChunks([]);
+    setTimings(null);
+    let resp;
+    try {
+      resp = await fetch("/qa/ask/stream", {
+        method: "POST", headers: {"Content-Type":"application/json"},
+        body: JSON.stringify({case_id: caseId, question: question})
+      });
+    } catch (e) {
+      setAnswer(`[请求失败: ${e.message}]`);
+      return;
+    }
+    if (!resp.ok) {
+      // errors before the stream starts (400 bad time_anchor, 503/504 ...) come back as JSON {detail}
+      let detail = resp.statusText;
+      try {
+        const j = await resp.json();
+        detail = typeof j.detail === "string" ? j.detail : JSON.stringify(j.detail ?? j);
+      } catch (e) {}
+      setAnswer(`[请求失败 ${resp.status}: ${detail}]`);
+      return;
+    }
+    // parse server-sent events: "event: <name>\ndata: <json>\n\n"
+    const reader = resp.body.getReader();
+    const decoder = new TextDecoder("utf-8");
+    let buf = "";
+    let text = "";
+    while (true) {
+      const {value, done} = await reader.read();
+      if (done) break;
+      buf += decoder.decode(value, {stream: true});
+      let idx;
+      while ((idx = buf.indexOf("\n\n")) >= 0) {
+        const frame = buf.slice(0, idx);
+        buf = buf.slice(idx + 2);
+        let event = "message", data = "";
+        for (const line of frame.split("\n")) {
+          if (line.startsWith("event:")) event = line.slice(6).trim();
+          else if (line.startsWith("data:")) data += line.slice(5).trim();
+        }
+        if (!data) continue;
+        const j = JSON.parse(data);
+        if (event === "citations") {
+          setChunks(j.citations || []);
+          setAnswer("生成中...");
+        } else if (event === "token") {
+          text += j.delta;
+          setAnswer(text);
+        } else if (event === "error") {
+          setAnswer(text + "\n\n[" + j.message + "]");
+        } else if (event === "done") {
+          setTimings(j.timings);
+        }
+      }
+    }
   }
 
   async function loadAssets(){
@@ -44,6 +93,9 @@ export default function App(){
       <button onClick={ask}>提问</button>
       <h3>答案</h3>
       <pre style={{whiteSpace:"pre-wrap",background:"#f6f6f6",padding:10}}>{answer}</pre>
+      {timings ? (
+        <div style={{color:"#888",fontSize:12}}>检索 {timings.retrieval_ms} ms · 首字 {timings.first_token_ms ?? "-"} ms · 总计 {timings.total_ms} ms</div>
+      ) : null}
       <h3>检索到的引用片段</h3>
       <ul>
         {chunks.map(c=>(<li key={c.chunk_id}>{c.chunk_id} — {c.asset} p.{c.page}</li>))}
@@ -1,45 +1,202 @@
 """
 workers/asr_transcribe.py
 - Transcribe audio/video using faster-whisper (CPU/GPU).
-- Requires ffmpeg available in container.
-- Writes SRT and JSON to /data/cases/<case_id>/parsed/asr/
+- Requires ffmpeg/ffprobe in the container; audio is streamed through a pipe (16 kHz mono PCM, no temp WAV) into
+  a single float32 buffer: memory per file ~ 64 KB per second of audio (~230 MB per hour), plus a 1 MiB block.
+- VAD (silero, built into faster-whisper) skips silence before decoding.
+- Files run in parallel on a process pool; each worker loads the model once (--model / ASR_MODEL,
+  --compute-type / ASR_COMPUTE_TYPE, e.g. int8 on CPU).
+- A long-lived worker (Celery ASR queue, api/tasks) can load the model once with warm_model(); main() then
+  transcribes in-process with that model instead of starting a pool when workers is 1.
+- Segments are streamed to SRT and JSON as they are produced, under /data/cases/<case_id>/parsed/asr/.
+- Segments are grouped into timecoded chunks (parsed/asr/<name>.chunks.jsonl) and merged into
+  parsed/chunks.jsonl (meta.kind = "asr", chunks.timecode set by index_builder), so hearings are searchable.
+Usage: python workers/asr_transcribe.py <case_id> [--workers N] [--model medium] [--compute-type int8] [--threads T]
 """
-import os, sys, json, subprocess
-from faster_whisper import WhisperModel
+import os, sys, json, time, argparse, subprocess
+import numpy as np
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from chunk_io import file_sha256, make_chunk_id, write_if_changed, load_asr_chunks, merged_label
 
-def extract_audio(input_path, out_wav):
-    subprocess.run(["ffmpeg","-y","-i",input_path,"-ar","16000","-ac","1",out_wav], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+MEDIA_EXTS = (".mp3",".wav",".m4a",".aac",".flac",".amr",".mp4",".mov",".mkv",".avi",".wmv",".flv")
+SAMPLE_RATE = 16000
+CHUNK_CHARS = 300       # target transcript characters per chunk
+CHUNK_SECONDS = 60.0    # ...or at most this much audio
+DECODE_BLOCK_BYTES = 1 << 20
 
-def main(case_id):
+def probe_duration(input_path):
+    try:
+        out = subprocess.run(["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", input_path],
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True, text=True).stdout
+        return float(out.strip())
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return None
+
+def decode_audio(input_path, sr=SAMPLE_RATE, block_bytes=DECODE_BLOCK_BYTES):
+    """
+    ffmpeg -> stdout pipe -> float32 mono samples, as faster-whisper expects.
+    The pipe is read in blocks converted straight into one float32 buffer (sized from ffprobe's duration,
+    grown in place if that is short), so peak memory is the float32 audio (4 bytes * sr per second, ~230 MB
+    per hour at 16 kHz) plus one block, not the int16 stream plus a second float32 copy.
+    """
+    cmd = ["ffmpeg", "-nostdin", "-threads", "0", "-i", input_path, "-f", "s16le", "-ac", "1", "-ar", str(sr), "-"]
+    duration = probe_duration(input_path)
+    out = np.empty(int((duration or 600.0) * sr) + sr, dtype=np.float32)
+    n = 0
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            block = proc.stdout.read(block_bytes)
+            if not block:
+                break
+            pcm = np.frombuffer(block, dtype=np.int16, count=len(block) // 2)
+            if n + len(pcm) > len(out):
+                out.resize(max(n + len(pcm), int(len(out) * 1.5)), refcheck=False)
+            np.multiply(pcm, np.float32(1.0 / 32768.0), out=out[n:n + len(pcm)], casting="unsafe")
+            n += len(pcm)
+    finally:
+        proc.stdout.close()
+        rc = proc.wait()
+    if rc != 0:
+        raise subprocess.CalledProcessError(rc, cmd)
+    out.resize(n, refcheck=False)  # shrink in place
+    return out
+
+def fmt_time(t, sep=","):
+    ms = int(round((t - int(t)) * 1000)) % 1000
+    h = int(t // 3600); m = int((t % 3600)//60); s = int(t % 60)
+    return f"{h:02d}:{m:02d}:{s:02d}{sep}{ms:03d}"
+
+def group_segments(segments, max_chars=CHUNK_CHARS, max_seconds=CHUNK_SECONDS):
+    """
+    Consecutive segments -> [(start, end, text)] windows bounded by characters and duration.
+    """
+    out, cur = [], []
+    for seg in segments:
+        if cur and (sum(len(s["text"]) for s in cur) + len(seg["text"]) > max_chars
+                    or seg["end"] - cur[0]["start"] > max_seconds):
+            out.append((cur[0]["start"], cur[-1]["end"], "".join(s["text"] for s in cur)))
+            cur = []
+        cur.append(seg)
+    if cur:
+        out.append((cur[0]["start"], cur[-1]["end"], "".join(s["text"] for s in cur)))
+    return out
+
+_MODEL = None
+
+def _init_worker(model_size, compute_type, threads):
+    global _MODEL
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    from faster_whisper import WhisperModel
+    _MODEL = WhisperModel(model_size, device="cpu", compute_type=compute_type, cpu_threads=threads)
+
+def warm_model(model_size="medium", compute_type="int8", threads=None):
+    if _MODEL is None:
+        _init_worker(model_size, compute_type, int(threads or os.cpu_count() or 1))
+    return _MODEL
+
+def transcribe_file(case_id, src, out_dir, language="zh"):
+    name = os.path.basename(src)
+    t0 = time.monotonic()
+    audio = decode_audio(src)
+    segments, info = _MODEL.transcribe(audio, language=language, vad_filter=True,
+                                       vad_parameters={"min_silence_duration_ms": 500})
+    srt_path = os.path.join(out_dir, name + ".srt")
+    json_path = os.path.join(out_dir, name + ".json")
+    segs = []
+    # segments is a lazy generator: consume it once, writing both outputs as segments arrive
+    with open(srt_path + ".tmp", "w", encoding="utf-8") as srt, open(json_path + ".tmp", "w", encoding="utf-8") as jf:
+        jf.write('{"source": %s, "duration": %.3f, "segments": [\n' % (json.dumps(name, ensure_ascii=False), info.duration))
+        for i, seg in enumerate(segments, start=1):
+            text = seg.text.strip()
+            srt.write(f"{i}\n{fmt_time(seg.start)} --> {fmt_time(seg.end)}\n{text}\n\n")
+            item = {"start": round(seg.start, 3), "end": round(seg.end, 3), "text": text}
+            jf.write(("" if i == 1 else ",\n") + json.dumps(item, ensure_ascii=False))
+            srt.flush(); jf.flush()
+            segs.append(item)
+        jf.write("\n]}\n")
+    os.replace(srt_path + ".tmp", srt_path)
+    os.replace(json_path + ".tmp", json_path)
+    asset_sha = file_sha256(src)
+    chunks = []
+    for seg_no, (start, end, text) in enumerate(group_segments(segs)):
+        timecode = f"{fmt_time(start, '.')}-{fmt_time(end, '.')}"
+        chunks.append({
+            "chunk_id": make_chunk_id(case_id, asset_sha, timecode, seg_no, text),
+            "source_type": "case",
+            "source_id": name,
+            "text": text,
+            "timecode": timecode,
+            "meta": {"page": None, "asset": name, "case_id": case_id, "asset_sha256": asset_sha,
+                     "kind": "asr", "timecode": timecode, "start": start, "end": end}
+        })
+    write_if_changed(os.path.join(out_dir, name + ".chunks.jsonl"),
+                     "".join(json.dumps(c, ensure_ascii=False) + "\n" for c in chunks))
+    elapsed = time.monotonic() - t0
+    return name, len(segs), len(chunks), info.duration, elapsed
+
+def merge_into_case(case_id):
+    """
+    Replace the ASR chunks in parsed/chunks.jsonl and merged.txt with the current per-file transcripts.
+    """
+    parsed = f"/data/cases/{case_id}/parsed"
+    jl = os.path.join(parsed, "chunks.jsonl")
+    chunks = []
+    if os.path.exists(jl):
+        with open(jl, "r", encoding="utf-8") as f:
+            chunks = [c for c in map(json.loads, f) if c.get("meta", {}).get("kind") != "asr"]
+    names = sorted(os.listdir(f"/data/cases/{case_id}/assets"))
+    chunks += load_asr_chunks(parsed, names)
+    changed = write_if_changed(jl, "".join(json.dumps(c, ensure_ascii=False) + "\n" for c in chunks))
+    write_if_changed(os.path.join(parsed, "merged.txt"),
+                     "".join(f"【{merged_label(c)}】\n{c['text']}\n\n" for c in chunks))
+    return changed
+
+def main(case_id, workers=1, model_size="medium", compute_type="int8", threads=None, merge=True):
     assets = f"/data/cases/{case_id}/assets"
     out_dir = f"/data/cases/{case_id}/parsed/asr"
     os.makedirs(out_dir, exist_ok=True)
-    model = WhisperModel("medium", device="auto", compute_type="auto")
-    for name in os.listdir(assets):
-        if not name.lower().endswith((".mp3",".wav",".m4a",".mp4",".mov",".mkv")):
-            continue
-        src = os.path.join(assets, name)
-        wav = os.path.join(out_dir, name + ".wav")
-        extract_audio(src, wav)
-        segments, info = model.transcribe(wav, language="zh")
-        srt_path = os.path.join(out_dir, name + ".srt")
-        json_path = os.path.join(out_dir, name + ".json")
-        # write srt
-        def fmt_time(t):
-            ms = int((t - int(t)) * 1000)
-            h = int(t // 3600); m = int((t % 3600)//60); s = int(t % 60)
-            return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
-        with open(srt_path, "w", encoding="utf-8") as srt:
-            for i, seg in enumerate(segments, start=1):
-                srt.write(f"{i}\n{fmt_time(seg.start)} --> {fmt_time(seg.end)}\n{seg.text.strip()}\n\n")
-        # write json
-        with open(json_path, "w", encoding="utf-8") as jf:
-            jf.write(json.dumps({"source": name, "segments":[{"start":seg.start,"end":seg.end,"text":seg.text} for seg in segments]}, ensure_ascii=False, indent=2))
-        print(f"[ok] ASR -> {srt_path}")
+    files = [os.path.join(assets, n) for n in sorted(os.listdir(assets)) if n.lower().endswith(MEDIA_EXTS)]
+    if not files:
+        print("[i] no audio/video assets")
+        return 0
+    ncpu = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    workers = max(1, min(int(workers or 1), len(files)))
+    threads = int(threads or max(1, ncpu // workers))
+    t0 = time.monotonic()
+    audio_seconds = 0.0
+    if workers == 1 and _MODEL is not None:
+        # warm in-process model (warm_model): no pool, no reload
+        results = (transcribe_file(case_id, src, out_dir) for src in files)
+        pool = None
+    else:
+        ctx = mp.get_context("spawn")  # ctranslate2 is not fork-safe once loaded
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                                   initargs=(model_size, compute_type, threads))
+        results = (fut.result() for fut in as_completed([pool.submit(transcribe_file, case_id, src, out_dir)
+                                                         for src in files]))
+    try:
+        for name, n_segs, n_chunks, duration, elapsed in results:
+            audio_seconds += duration
+            print(f"[ok] ASR {name}: {n_segs} segments, {n_chunks} chunks, {duration:.0f}s audio in {elapsed:.0f}s "
+                  f"({duration / max(elapsed, 1e-9):.1f}x realtime)")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    if merge:
+        merge_into_case(case_id)
+    elapsed = time.monotonic() - t0
+    print(f"[ok] ASR {len(files)} files, {audio_seconds:.0f}s audio in {elapsed:.0f}s with {workers} workers x {threads} threads")
     return 0
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python workers/asr_transcribe.py <case_id>")
-        sys.exit(1)
-    sys.exit(main(sys.argv[1]))
+    ap = argparse.ArgumentParser(description="Transcribe case audio/video into SRT/JSON and timecoded chunks")
+    ap.add_argument("case_id")
+    ap.add_argument("--workers", type=int, default=int(os.environ.get("ASR_WORKERS", 1)))
+    ap.add_argument("--model", default=os.environ.get("ASR_MODEL", "medium"), help="faster-whisper model size or path")
+    ap.add_argument("--compute-type", default=os.environ.get("ASR_COMPUTE_TYPE", "int8"))
+    ap.add_argument("--threads", type=int, default=None, help="CPU threads per worker")
+    args = ap.parse_args()
+    sys.exit(main(args.case_id, args.workers, args.model, args.compute_type, args.threads))
@@ -0,0 +1,75 @@
+"""
+workers/chunk_io.py
+- Dependency-free chunk and file helpers shared by ocr_parse and asr_transcribe (and pipeline_runner), so the
+  ASR worker does not need the PDF/image stack (fitz, pdfplumber, PIL) that ocr_parse imports.
+"""
+import os, re, json, hashlib
+
+_SENT_END = re.compile(r"(?<=[。！？；!?;\n])")
+
+def file_sha256(path, bufsize=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(bufsize), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def make_chunk_id(case_id, asset_sha, page, seg, text):
+    text_sha = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{case_id}|{asset_sha}|{page}|{seg}|{text_sha}".encode("utf-8")).hexdigest()[:32]
+
+def write_if_changed(path, data: str):
+    """
+    Atomic write that leaves the file (and its mtime) alone when the content is identical, so downstream
+    mtime/sha based staleness checks (vector artifact, answer cache) do not fire for a no-op parse.
+    """
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            if f.read() == data:
+                return False
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return True
+
+def load_asr_chunks(out_dir, names):
+    """
+    Timecoded transcript chunks written by asr_transcribe (parsed/asr/<name>.chunks.jsonl) for assets still present.
+    """
+    out = []
+    for name in names:
+        p = os.path.join(out_dir, "asr", name + ".chunks.jsonl")
+        if os.path.exists(p):
+            with open(p, "r", encoding="utf-8") as f:
+                out.extend(json.loads(line) for line in f if line.strip())
+    return out
+
+def merged_label(c):
+    meta = c["meta"]
+    return f"{meta.get('asset')} {meta['timecode']}" if meta.get("timecode") else f"{meta.get('asset')} p.{meta.get('page')}"
+
+def split_long(chunks, max_len=800):
+    """
+    Streaming re-chunker: texts longer than max_len are cut at sentence ends (hard cut if there is none);
+    the pieces get content-addressed ids derived from the parent chunk id.
+    """
+    for c in chunks:
+        text = c["text"]
+        if len(text) <= max_len:
+            yield c
+            continue
+        pieces, buf = [], ""
+        for sent in _SENT_END.split(text):
+            if buf and len(buf) + len(sent) > max_len:
+                pieces.append(buf)
+                buf = ""
+            buf += sent
+            while len(buf) > max_len:
+                pieces.append(buf[:max_len])
+                buf = buf[max_len:]
+        if buf:
+            pieces.append(buf)
+        for i, piece in enumerate(pieces):
+            cid = hashlib.sha256(f"{c['chunk_id']}|{i}|{piece}".encode("utf-8")).hexdigest()[:32]
+            yield {**c, "chunk_id": cid, "text": piece, "meta": {**c.get("meta", {}), "part": i}}
@@ -0,0 +1,152 @@
+"""
+workers/embed_pool.py
+- Multi-core embedding engine for the indexing workers (index_builder, milvus_indexer).
+- Inputs are sorted by token length and cut into buckets under a padded-token budget, so short OCR
+  snippets are not padded to the length of whole docx paragraphs.
+- Batches are spread over a process pool; each worker loads the model once with a pinned torch/ORT
+  thread count (optionally pinned to its own cores), and results are restored to input order.
+- max_seq_length caps tokenization for both bucketing and the model; None (both paths) keeps the model's own
+  limit, so the pool and the in-process model encode identically.
+- keep_resident(): long-lived processes (the Celery index workers, api/tasks) load the model once and
+  load_encoder(workers=1) hands it out instead of reloading it per task.
+- Benchmark against the single-process path: scripts/bench_embed_pool.py
+"""
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing as mp
+from onnx_backend import load_embedder
+
+_MODEL = None
+_RESIDENT = {}  # model_name -> model kept loaded for the life of the process
+
+def _set_max_seq_length(model, max_seq_length):
+    """
+    Cap the model at max_seq_length; None restores the model's original limit (a resident model is shared by
+    later tasks and must not keep an earlier task's cap).
+    """
+    attr = "max_seq_length" if hasattr(model, "max_seq_length") else "max_length" if hasattr(model, "max_length") else None
+    if attr is None:
+        return
+    if not hasattr(model, "_original_max_seq_length"):
+        model._original_max_seq_length = getattr(model, attr)
+    setattr(model, attr, int(max_seq_length) if max_seq_length else model._original_max_seq_length)
+
+def _init_worker(model_name, backend, threads, max_seq_length, slot_counter, pin_cpus):
+    global _MODEL
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    if pin_cpus and hasattr(os, "sched_setaffinity"):
+        with slot_counter.get_lock():
+            slot = slot_counter.value
+            slot_counter.value += 1
+        cpus = sorted(os.sched_getaffinity(0))
+        mine = cpus[slot * threads:(slot + 1) * threads]
+        if mine:
+            os.sched_setaffinity(0, mine)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    except Exception:
+        pass
+    _MODEL = load_embedder(model_name, backend, threads)
+    _set_max_seq_length(_MODEL, max_seq_length)
+
+def _encode_batch(idx, texts):
+    vecs = _MODEL.encode(texts, batch_size=len(texts), normalize_embeddings=False)
+    return idx, np.asarray(vecs, dtype=np.float32)
+
+class EmbeddingPool:
+    def __init__(self, model_name, workers=None, threads_per_worker=None, max_seq_length=None,
+                 batch_tokens=16384, max_batch=128, backend=None, pin_cpus=True):
+        ncpu = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+        self.threads = int(threads_per_worker or (4 if ncpu >= 8 else 1))
+        self.workers = int(workers or max(1, ncpu // self.threads))
+        self.model_name = model_name
+        self.max_seq_length = int(max_seq_length) if max_seq_length else None  # None: the model's own limit
+        self.batch_tokens = int(batch_tokens)
+        self.max_batch = int(max_batch)
+        self._tokenizer = None
+        ctx = mp.get_context("spawn")  # torch is not fork-safe once initialized
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx, initializer=_init_worker,
+                                         initargs=(model_name, backend, self.threads, self.max_seq_length,
+                                                   ctx.Value("i", 0), pin_cpus))
+        self._dim = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def token_lengths(self, texts):
+        if self._tokenizer is None:
+            try:
+                from transformers import AutoTokenizer
+                self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+            except Exception as e:
+                print("[warn] embed pool: tokenizer unavailable, bucketing by characters:", e)
+                self._tokenizer = False
+        if self._tokenizer is False:
+            return np.minimum([len(t) + 2 for t in texts], self.max_seq_length or 512)
+        enc = self._tokenizer(list(texts), add_special_tokens=True, truncation=True, max_length=self.max_seq_length)
+        return np.fromiter((len(ids) for ids in enc["input_ids"]), dtype=np.int64, count=len(texts))
+
+    def buckets(self, lengths):
+        """
+        Index batches in ascending length order; each batch has padded size (max len * n) <= batch_tokens.
+        """
+        order = np.argsort(lengths, kind="stable")
+        batch, longest = [], 0
+        for i in order:
+            l = int(lengths[i])
+            if batch and (len(batch) >= self.max_batch or max(longest, l) * (len(batch) + 1) > self.batch_tokens):
+                yield batch
+                batch, longest = [], 0
+            batch.append(int(i))
+            longest = max(longest, l)
+        if batch:
+            yield batch
+
+    def encode(self, texts, normalize_embeddings=True, **_):
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self._dim or 0), dtype=np.float32)
+        lengths = self.token_lengths(texts)
+        futures = [self._pool.submit(_encode_batch, idx, [texts[i] for i in idx]) for idx in self.buckets(lengths)]
+        out = None
+        for fut in as_completed(futures):
+            idx, vecs = fut.result()
+            if out is None:
+                self._dim = vecs.shape[1]
+                out = np.empty((len(texts), self._dim), dtype=np.float32)
+            out[idx] = vecs
+        if normalize_embeddings:
+            out /= np.clip(np.linalg.norm(out, axis=1, keepdims=True), 1e-12, None)
+        return out
+
+def load_encoder(model_name, workers=1, max_seq_length=None, **kwargs):
+    """
+    workers > 1: an EmbeddingPool (call close() when done); otherwise the in-process model.
+    """
+    if workers and int(workers) > 1:
+        return EmbeddingPool(model_name, workers=int(workers), max_seq_length=max_seq_length, **kwargs)
+    model = _RESIDENT.get(model_name) or load_embedder(model_name, kwargs.get("backend"))
+    _set_max_seq_length(model, max_seq_length)
+    return model
+
+def keep_resident(model_name, backend=None):
+    """
+    Load the model now and reuse it for every later single-process load_encoder() call.
+    """
+    if model_name not in _RESIDENT:
+        _RESIDENT[model_name] = load_embedder(model_name, backend)
+    return _RESIDENT[model_name]
+
+def close_encoder(model):
+    if isinstance(model, EmbeddingPool):
+        model.close()
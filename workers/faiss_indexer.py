@@ -0,0 +1,77 @@
+"""
+workers/faiss_indexer.py
+- Per-case on-disk FAISS index for a Milvus-free ANN path (api/faiss_client.py memory-maps it).
+- Built from the case's shared vector artifact (workers/vector_artifact.py), so it holds the same vectors as
+  pgvector and Milvus; index_builder calls build() after loading Postgres.
+- Inner product over normalized vectors (= cosine). HNSW (M=32, efConstruction=200) by default; cases above
+  --ivfpq-min rows use IVF-PQ to keep the file (and the API's memory budget) small.
+- Output: /data/cases/<case_id>/parsed/faiss/index.faiss + ids.json (row -> chunk_id), replaced atomically;
+  the API reloads when the index file's mtime changes.
+Usage: python workers/faiss_indexer.py <case_id> [model_name] [--ivfpq-min 200000]
+"""
+import os, sys, json, time, argparse
+import numpy as np
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+IVFPQ_MIN_ROWS = 200000
+
+def index_dir(case_id):
+    return f"/data/cases/{case_id}/parsed/faiss"
+
+def make_index(vecs, ivfpq_min=IVFPQ_MIN_ROWS):
+    import faiss
+    n, dim = vecs.shape
+    if n >= ivfpq_min:
+        nlist = int(4 * np.sqrt(n))
+        m = next(m for m in (64, 48, 32, 16, 8) if dim % m == 0)
+        index = faiss.IndexIVFPQ(faiss.IndexFlatIP(dim), dim, nlist, m, 8, faiss.METRIC_INNER_PRODUCT)
+        sample = vecs[np.random.default_rng(0).choice(n, size=min(n, nlist * 64), replace=False)]
+        index.train(np.ascontiguousarray(sample, dtype=np.float32))
+        kind = f"IVF{nlist},PQ{m}"
+    else:
+        index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        kind = f"HNSW{HNSW_M}"
+    # add in slices straight from the memmap
+    for start in range(0, n, 65536):
+        index.add(np.ascontiguousarray(vecs[start:start + 65536], dtype=np.float32))
+    return index, kind
+
+def build(case_id, chunk_ids, vecs, model_name, ivfpq_min=IVFPQ_MIN_ROWS):
+    import faiss
+    out = index_dir(case_id)
+    os.makedirs(out, exist_ok=True)
+    t0 = time.monotonic()
+    index, kind = make_index(vecs, ivfpq_min)
+    tmp_index, tmp_ids = os.path.join(out, "index.faiss.tmp"), os.path.join(out, "ids.json.tmp")
+    faiss.write_index(index, tmp_index)
+    with open(tmp_ids, "w", encoding="utf-8") as f:
+        json.dump({"model": model_name, "kind": kind, "dim": int(vecs.shape[1]), "chunk_ids": list(chunk_ids)}, f,
+                  ensure_ascii=False)
+    # ids first: the API keys its reload on the index file
+    os.replace(tmp_ids, os.path.join(out, "ids.json"))
+    os.replace(tmp_index, os.path.join(out, "index.faiss"))
+    print(f"[ok] faiss {kind} index for {case_id}: {len(chunk_ids)} vectors in {time.monotonic() - t0:.1f}s -> {out}")
+    return os.path.join(out, "index.faiss")
+
+def main(case_id, model_name=None, ivfpq_min=IVFPQ_MIN_ROWS, workers=None, max_seq_length=None):
+    from vector_artifact import ensure_artifact, encoder_options, DEFAULT_MODEL
+    model_name = model_name or DEFAULT_MODEL
+    parsed = f"/data/cases/{case_id}/parsed/chunks.jsonl"
+    if not os.path.exists(parsed):
+        print(f"[!] not found: {parsed} (run ocr_parse first)")
+        return 1
+    chunk_ids, vecs = ensure_artifact(case_id, model_name, chunks_path=parsed, **encoder_options(workers, max_seq_length))
+    if not chunk_ids:
+        print("[!] no chunks in", parsed); return 1
+    build(case_id, chunk_ids, vecs, model_name, ivfpq_min)
+    return 0
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Build the per-case FAISS index from the vector artifact")
+    ap.add_argument("case_id")
+    ap.add_argument("model_name", nargs="?", default=None, help="default EMBED_MODEL")
+    ap.add_argument("--ivfpq-min", type=int, default=IVFPQ_MIN_ROWS, help="use IVF-PQ at or above this many rows")
+    args = ap.parse_args()
+    sys.exit(main(args.case_id, args.model_name, args.ivfpq_min))
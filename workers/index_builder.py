@@ -2,53 +2,242 @@
 workers/index_builder.py
 - Build BM25-like (text) and vector index using sentence-transformers (bge-large-zh).
 - Writes to Postgres(pgvector) via simple SQL upserts.
+- Chunks of the case that are no longer in chunks.jsonl are deleted (chunk ids are content-addressed, see ocr_parse).
+- --incremental: only embeds chunks that are new or lack an embedding for this model; reports added/unchanged/removed.
+- --stream: reads chunks.jsonl in fixed-size batches, encodes each batch and bulk-loads it with COPY into
+  temp staging tables followed by a set-based upsert, one transaction per batch; memory stays bounded by
+  --batch-size regardless of case size, and rows/sec is reported per batch and overall.
+- Vectors come from the case's shared vector artifact (workers/vector_artifact.py), which milvus_indexer reads
+  too; the case is only encoded if the artifact is missing or stale.
+- chunks.case_id and chunks.tsv (to_tsvector('simple') over Chinese-segmented text, workers/text_segment.py)
+  are written with each chunk for case-scoped full-text search (db/004_chunks_case_tsv.sql), together with the
+  segmenter that produced tsv (chunks.tsv_segmenter, db/008); chunks segmented differently count as not indexed.
+- Also (re)builds the case's FAISS index (workers/faiss_indexer.py) from the same artifact unless --no-faiss.
+- --workers N: embed with the multi-core length-bucketed pool (workers/embed_pool.py); --max-seq-length caps tokens.
+  Defaults come from vector_artifact.encoder_options (EMBED_MODEL / EMBED_WORKERS / EMBED_MAX_SEQ_LENGTH).
 """
-import os, sys, json, uuid, psycopg2
-from sentence_transformers import SentenceTransformer
+import os, sys, io, csv, json, time, uuid, argparse, itertools, psycopg2
+from vector_artifact import ensure_artifact, encoder_options, DEFAULT_MODEL
+from text_segment import segment, segmenter
 import numpy as np
 
 def conn(db_url):
     return psycopg2.connect(db_url)
 
 def upsert_chunk(cur, c):
-    cur.execute("""INSERT INTO chunks(chunk_id, source_type, source_id, text, meta, page, timecode)
-                   VALUES (%s,%s,%s,%s,%s,%s,%s)
-                   ON CONFLICT (chunk_id) DO NOTHING""",
-                (c["chunk_id"], c["source_type"], c["source_id"], c["text"], json.dumps(c.get("meta",{})), c.get("meta",{}).get("page"), None))
+    cur.execute("""INSERT INTO chunks(chunk_id, source_type, source_id, text, meta, page, timecode, case_id, tsv, tsv_segmenter)
+                   VALUES (%s,%s,%s,%s,%s,%s,%s,%s,to_tsvector('simple', %s),%s)
+                   ON CONFLICT (chunk_id) DO UPDATE SET source_id=EXCLUDED.source_id, meta=EXCLUDED.meta, page=EXCLUDED.page,
+                                                      timecode=EXCLUDED.timecode, case_id=EXCLUDED.case_id, tsv=EXCLUDED.tsv,
+                                                      tsv_segmenter=EXCLUDED.tsv_segmenter""",
+                (c["chunk_id"], c["source_type"], c["source_id"], c["text"], json.dumps(c.get("meta",{}), ensure_ascii=False),
+                 c.get("meta",{}).get("page"), c.get("timecode"), c.get("meta",{}).get("case_id"), segment(c["text"]),
+                 segmenter()))
 
-def upsert_vec(cur, chunk_id, vec, model_name):
-    cur.execute("""INSERT INTO embeddings(chunk_id, model, vector) VALUES (%s,%s,%s)
-                   ON CONFLICT (chunk_id) DO UPDATE SET model=EXCLUDED.model, vector=EXCLUDED.vector""",
-                (chunk_id, model_name, vec.tolist()))
+def upsert_vec(cur, chunk_id, vec, model_name, case_id=None):
+    cur.execute("""INSERT INTO embeddings(chunk_id, model, vector, case_id) VALUES (%s,%s,%s,%s)
+                   ON CONFLICT (chunk_id) DO UPDATE SET model=EXCLUDED.model, vector=EXCLUDED.vector, case_id=EXCLUDED.case_id""",
+                (chunk_id, model_name, vec.tolist(), case_id))
+
+def invalidate_answer_cache(cur, case_id):
+    # cached QA answers were built from the previous index of this case
+    try:
+        cur.execute("DELETE FROM qa_answer_cache WHERE case_id=%s", (case_id,))
+    except psycopg2.Error as e:
+        print("[warn] answer cache invalidation skipped:", e)
+
+def indexed_chunks(cur, case_id, model_name):
+    """
+    chunk_id -> True if it already has an embedding from model_name and a full-text vector from the current segmenter.
+    """
+    cur.execute("""SELECT c.chunk_id, e.model IS NOT DISTINCT FROM %s AND e.vector IS NOT NULL AND c.tsv IS NOT NULL
+                          AND c.tsv_segmenter IS NOT DISTINCT FROM %s AND e.case_id IS NOT NULL
+                   FROM chunks c LEFT JOIN embeddings e ON e.chunk_id = c.chunk_id
+                   WHERE c.case_id = %s OR (c.case_id IS NULL AND c.meta @> %s::jsonb)""",
+                (model_name, segmenter(), case_id, json.dumps({"case_id": case_id})))
+    return dict(cur.fetchall())
+
+def delete_chunks(cur, chunk_ids):
+    if not chunk_ids:
+        return
+    cur.execute("DELETE FROM embeddings WHERE chunk_id = ANY(%s)", (list(chunk_ids),))
+    cur.execute("DELETE FROM chunks WHERE chunk_id = ANY(%s)", (list(chunk_ids),))
+
+STAGE_DDL = """
+CREATE TEMP TABLE IF NOT EXISTS stage_chunks (
+  chunk_id TEXT, source_type TEXT, source_id TEXT, text TEXT, meta JSONB, page INT, timecode TEXT,
+  case_id TEXT, seg_text TEXT
+) ON COMMIT DELETE ROWS;
+CREATE TEMP TABLE IF NOT EXISTS stage_embeddings (
+  chunk_id TEXT, model TEXT, vector vector, case_id TEXT
+) ON COMMIT DELETE ROWS;
+"""
+
+def _csv_buffer(rows):
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    buf.seek(0)
+    return buf
+
+def copy_batch(cur, batch, vecs, model_name):
+    """
+    COPY one batch into the staging tables, then upsert set-based into chunks/embeddings.
+    Caller owns the transaction.
+    """
+    chunk_rows = [(c["chunk_id"], c["source_type"], c["source_id"], c["text"],
+                   json.dumps(c.get("meta",{}), ensure_ascii=False), c.get("meta",{}).get("page"), c.get("timecode"),
+                   c.get("meta",{}).get("case_id"), segment(c["text"]))
+                  for c in batch]
+    # pgvector text input: "[x, y, ...]"
+    vec_rows = [(c["chunk_id"], model_name, str(v.tolist()), c.get("meta",{}).get("case_id")) for c, v in zip(batch, vecs)]
+    cur.copy_expert("COPY stage_chunks FROM STDIN WITH (FORMAT csv)", _csv_buffer(chunk_rows))
+    cur.copy_expert("COPY stage_embeddings FROM STDIN WITH (FORMAT csv)", _csv_buffer(vec_rows))
+    cur.execute("""INSERT INTO chunks(chunk_id, source_type, source_id, text, meta, page, timecode, case_id, tsv, tsv_segmenter)
+                   SELECT DISTINCT ON (chunk_id) chunk_id, source_type, source_id, text, meta, page, timecode,
+                          case_id, to_tsvector('simple', seg_text), %s FROM stage_chunks
+                   ON CONFLICT (chunk_id) DO UPDATE SET source_id=EXCLUDED.source_id, meta=EXCLUDED.meta,
+                                                      page=EXCLUDED.page, timecode=EXCLUDED.timecode,
+                                                      case_id=EXCLUDED.case_id, tsv=EXCLUDED.tsv,
+                                                      tsv_segmenter=EXCLUDED.tsv_segmenter""", (segmenter(),))
+    cur.execute("""INSERT INTO embeddings(chunk_id, model, vector, case_id)
+                   SELECT DISTINCT ON (chunk_id) chunk_id, model, vector, case_id FROM stage_embeddings
+                   ON CONFLICT (chunk_id) DO UPDATE SET model=EXCLUDED.model, vector=EXCLUDED.vector,
+                                                      case_id=EXCLUDED.case_id""")
+
+def artifact_rows(case_id, parsed, model_name, encoder_opts=None):
+    """
+    (chunk_id -> row, vectors memmap) from the case's shared vector artifact.
+    """
+    ids, vecs = ensure_artifact(case_id, model_name, chunks_path=parsed, **(encoder_opts or {}))
+    return {cid: i for i, cid in enumerate(ids)}, vecs
+
+def stream_index(con, case_id, parsed, model_name, incremental=False, batch_size=512, encoder_opts=None):
+    """
+    Bounded-memory indexing: batch_size chunks are read, sliced from the memory-mapped artifact and COPY-loaded at a time.
+    """
+    t_embed = time.monotonic()
+    rows, mat = artifact_rows(case_id, parsed, model_name, encoder_opts)
+    t_embed = time.monotonic() - t_embed
+    cur = con.cursor()
+    cur.execute(STAGE_DDL)
+    existing = indexed_chunks(cur, case_id, model_name)
+    con.commit()
+    seen = set()
+    stats = {"rows": 0, "embedded": 0, "added": 0, "skipped": 0}
+    t_start = time.monotonic()
+    it = load_jsonl(parsed)
+    for n_batch in itertools.count(1):
+        raw = list(itertools.islice(it, batch_size))
+        if not raw:
+            break
+        batch = []
+        for c in raw:
+            c.setdefault("meta", {})["case_id"] = case_id
+            seen.add(c["chunk_id"])
+            stats["added"] += c["chunk_id"] not in existing
+            if incremental and existing.get(c["chunk_id"]):
+                stats["skipped"] += 1
+            else:
+                batch.append(c)
+        stats["rows"] += len(raw)
+        if not batch:
+            continue
+        t1 = time.monotonic()
+        # fancy indexing copies only this batch's rows out of the memmap
+        vecs = np.asarray(mat[[rows[c["chunk_id"]] for c in batch]], dtype=np.float32)
+        try:
+            copy_batch(cur, batch, vecs, model_name)
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+        t2 = time.monotonic()
+        stats["embedded"] += len(batch)
+        print(f"[i] batch {n_batch}: {len(batch)} rows, load {len(batch)/max(t2-t1,1e-9):.1f} rows/s")
+    removed = [cid for cid in existing if cid not in seen]
+    delete_chunks(cur, removed)
+    invalidate_answer_cache(cur, case_id)
+    con.commit()
+    cur.close()
+    elapsed = time.monotonic() - t_start
+    stats.update(removed=len(removed), unchanged=len(seen) - stats["added"], seconds=round(elapsed, 2),
+                 artifact_seconds=round(t_embed, 2),
+                 rows_per_s=round(stats["rows"] / elapsed, 1) if elapsed else 0.0)
+    return stats
 
 def load_jsonl(path):
     with open(path, "r", encoding="utf-8") as f:
         for line in f:
             yield json.loads(line)
 
-def main(case_id, db_url, model_name="BAAI/bge-large-zh"):
+def build_faiss(case_id, parsed, model_name, encoder_opts):
+    # the local ANN index is optional; Postgres stays the source of truth
+    try:
+        import faiss_indexer
+        ids, vecs = ensure_artifact(case_id, model_name, chunks_path=parsed, **encoder_opts)
+        if ids:
+            faiss_indexer.build(case_id, ids, vecs, model_name)
+    except ImportError as e:
+        print("[warn] faiss index skipped:", e)
+
+def main(case_id, db_url, model_name=None, incremental=False, stream=False, batch_size=512,
+         workers=None, max_seq_length=None, faiss=True):
+    model_name = model_name or DEFAULT_MODEL
     parsed = f"/data/cases/{case_id}/parsed/chunks.jsonl"
     if not os.path.exists(parsed):
         print(f"[!] not found: {parsed} (run ocr_parse first)")
         return 1
-    model = SentenceTransformer(model_name)
+    # same model/encoder settings as milvus_indexer and faiss_indexer -> same artifact fingerprint
+    encoder_opts = encoder_options(workers, max_seq_length)
+    if stream:
+        con = conn(db_url)
+        try:
+            st = stream_index(con, case_id, parsed, model_name, incremental, batch_size, encoder_opts)
+        finally:
+            con.close()
+        print(f"[ok] indexed case {case_id}: embedded={st['embedded']} added={st['added']} unchanged={st['unchanged']} "
+              f"removed={st['removed']} in {st['seconds']}s ({st['rows_per_s']} rows/s)")
+        if faiss:
+            build_faiss(case_id, parsed, model_name, encoder_opts)
+        return 0
     con = conn(db_url); con.autocommit = True
     cur = con.cursor()
-    batch = []
+    existing = indexed_chunks(cur, case_id, model_name)
+    chunks = []
     for c in load_jsonl(parsed):
+        c.setdefault("meta", {})["case_id"] = case_id
+        chunks.append(c)
+    current = {c["chunk_id"] for c in chunks}
+    removed = [cid for cid in existing if cid not in current]
+    todo = [c for c in chunks if not (incremental and existing.get(c["chunk_id"]))]
+    for c in todo:
         upsert_chunk(cur, c)
-        batch.append((c["chunk_id"], c["text"]))
-    texts = [t for _, t in batch]
-    if texts:
-        vecs = model.encode(texts, normalize_embeddings=True)
-        for (cid,_), v in zip(batch, vecs):
-            upsert_vec(cur, cid, np.array(v, dtype=np.float32), model_name)
+    if todo:
+        rows, mat = artifact_rows(case_id, parsed, model_name, encoder_opts)
+        for c in todo:
+            upsert_vec(cur, c["chunk_id"], np.array(mat[rows[c["chunk_id"]]], dtype=np.float32), model_name, case_id)
+    delete_chunks(cur, removed)
+    invalidate_answer_cache(cur, case_id)
     cur.close(); con.close()
-    print(f"[ok] indexed {len(texts)} chunks for case {case_id}")
+    added = len(current - existing.keys())
+    print(f"[ok] indexed case {case_id}: embedded={len(todo)} added={added} "
+          f"unchanged={len(current) - added} removed={len(removed)}")
+    if faiss:
+        build_faiss(case_id, parsed, model_name, encoder_opts)
     return 0
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: python workers/index_builder.py <case_id> <DB_URL> [model_name]")
-        sys.exit(1)
-    sys.exit(main(sys.argv[1], sys.argv[2], *(sys.argv[3:] if len(sys.argv)>3 else [])))
+    ap = argparse.ArgumentParser(description="Index parsed chunks into Postgres (pgvector)")
+    ap.add_argument("case_id")
+    ap.add_argument("db_url")
+    ap.add_argument("model_name", nargs="?", default=DEFAULT_MODEL)
+    ap.add_argument("--incremental", action="store_true", help="only embed new/changed chunks")
+    ap.add_argument("--stream", action="store_true", help="bounded-memory batches loaded via COPY")
+    ap.add_argument("--batch-size", type=int, default=512)
+    ap.add_argument("--workers", type=int, default=None, help="embedding processes (default EMBED_WORKERS)")
+    ap.add_argument("--max-seq-length", type=int, default=None, help="default EMBED_MAX_SEQ_LENGTH")
+    ap.add_argument("--no-faiss", action="store_true", help="skip the local FAISS index")
+    args = ap.parse_args()
+    sys.exit(main(args.case_id, args.db_url, args.model_name, incremental=args.incremental,
+                  stream=args.stream, batch_size=args.batch_size, workers=args.workers,
+                  max_seq_length=args.max_seq_length, faiss=not args.no_faiss))
@@ -0,0 +1,64 @@
+"""
+workers/law_embedder.py
+- Embed law articles (law title + article number + text) into law_article_embeddings
+  (db/006_law_article_embeddings.sql) for the API's in-memory law index (api/law_index.py).
+- Only articles that are new, edited (text sha256 changed) or embedded with another model are encoded;
+  deleted articles drop their rows via ON DELETE CASCADE. Run after scripts/import_laws.py.
+Usage: python workers/law_embedder.py <db_url> [model_name] [--workers N] [--batch-size 512] [--full]
+"""
+import os, sys, hashlib, argparse, psycopg2
+import numpy as np
+from embed_pool import load_encoder, close_encoder
+from vector_artifact import DEFAULT_MODEL
+
+def article_text(title, article_no, text):
+    return " ".join(p for p in (title, article_no, text) if p)
+
+def pending_articles(cur, model_name, full=False):
+    cur.execute("""SELECT a.id, l.title, a.article_no, a.text, e.model, e.text_sha256
+                   FROM law_articles a JOIN laws l ON l.law_id = a.law_id
+                   LEFT JOIN law_article_embeddings e ON e.article_id = a.id
+                   ORDER BY a.id""")
+    out = []
+    for aid, title, article_no, text, model, sha in cur.fetchall():
+        t = article_text(title, article_no, text)
+        t_sha = hashlib.sha256(t.encode("utf-8")).hexdigest()
+        if full or model != model_name or sha != t_sha:
+            out.append((aid, t, t_sha))
+    return out
+
+def main(db_url, model_name=DEFAULT_MODEL, workers=1, batch_size=512, full=False):
+    con = psycopg2.connect(db_url)
+    cur = con.cursor()
+    todo = pending_articles(cur, model_name, full)
+    if not todo:
+        print("[ok] law embeddings up to date")
+        con.close()
+        return 0
+    model = load_encoder(model_name, workers=workers)
+    try:
+        for start in range(0, len(todo), batch_size):
+            batch = todo[start:start + batch_size]
+            vecs = np.asarray(model.encode([t for _, t, _ in batch], normalize_embeddings=True), dtype=np.float32)
+            cur.executemany("""INSERT INTO law_article_embeddings(article_id, model, text_sha256, vector)
+                               VALUES (%s,%s,%s,%s::vector)
+                               ON CONFLICT (article_id) DO UPDATE SET model=EXCLUDED.model, text_sha256=EXCLUDED.text_sha256,
+                                                                     vector=EXCLUDED.vector, updated_at=now()""",
+                            [(aid, model_name, sha, str(v.tolist())) for (aid, _, sha), v in zip(batch, vecs)])
+            con.commit()
+            print(f"[i] embedded {min(start + batch_size, len(todo))}/{len(todo)} articles")
+    finally:
+        close_encoder(model)
+        cur.close(); con.close()
+    print(f"[ok] law embeddings: {len(todo)} articles (re)embedded with {model_name}")
+    return 0
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Embed law articles for time-anchored law retrieval")
+    ap.add_argument("db_url")
+    ap.add_argument("model_name", nargs="?", default=DEFAULT_MODEL)
+    ap.add_argument("--workers", type=int, default=int(os.environ.get("EMBED_WORKERS", 1)))
+    ap.add_argument("--batch-size", type=int, default=512)
+    ap.add_argument("--full", action="store_true", help="re-embed every article")
+    args = ap.parse_args()
+    sys.exit(main(args.db_url, args.model_name, args.workers, args.batch_size, args.full))
@@ -3,21 +3,96 @@ workers/milvus_indexer.py
 - Index parsed chunks into Milvus collection for fast ANN search.
 - Stores chunk_id and embedding; keeps text/meta in Postgres chunks table as canonical source.
 - Recommended index params for production demo: HNSW with M=32, efConstruction=200, metric IP.
-Usage: python workers/milvus_indexer.py <case_id> [milvus_host] [milvus_port] [collection_prefix]
+- layout "shared" (default, MILVUS_LAYOUT): one collection <prefix> keyed by chunk_id with case_id as partition key.
+  The index is created once; each run upserts the case's new chunk ids and deletes ids no longer in chunks.jsonl,
+  so the case stays searchable throughout and Milvus indexes the new segments incrementally.
+- layout "per_case": legacy drop-and-recreate of <prefix>_<case_id>.
+- After indexing, touches parsed/milvus_stamp.json (API handle invalidation for per_case, answer-cache generation).
+- Vectors come from the case's shared vector artifact (workers/vector_artifact.py), the same rows index_builder
+  loads into pgvector; the case is only encoded here if the artifact is missing or stale.
+- Model and encoder settings come from vector_artifact.encoder_options (EMBED_MODEL / EMBED_WORKERS /
+  EMBED_MAX_SEQ_LENGTH), the same ones index_builder and faiss_indexer use, so all of them share one artifact.
+Usage: python workers/milvus_indexer.py <case_id> [milvus_host] [milvus_port] [collection_prefix] [shared|per_case] [model_name]
 """
-import sys, os, json, uuid
+import sys, os, json, uuid, time
 from pymilvus import connections, FieldSchema, CollectionSchema, DataType, Collection, utility, DataType
-from sentence_transformers import SentenceTransformer
+from vector_artifact import ensure_artifact, encoder_options, DEFAULT_MODEL
 
-def main(case_id, host="milvus", port="19530", coll_prefix="legal_chunks"):
+INSERT_BATCH = 1000
+INDEX_PARAMS = {"index_type":"HNSW", "metric_type":"IP", "params":{"M":32, "efConstruction":200}}
+
+def write_stamp(case_id, coll_name, count):
+    # the API compares this file's mtime to invalidate its loaded-collection cache
+    stamp = f"/data/cases/{case_id}/parsed/milvus_stamp.json"
+    with open(stamp, "w", encoding="utf-8") as f:
+        json.dump({"collection": coll_name, "count": count, "built_at": time.time()}, f)
+
+def shared_collection(name, dim, num_partitions=64):
+    """
+    Create the multi-tenant collection and its index once; later runs reuse it.
+    """
+    if utility.has_collection(name):
+        return Collection(name)
+    fields = [
+        FieldSchema(name="chunk_id", dtype=DataType.VARCHAR, max_length=256, is_primary=True, description="chunk id"),
+        FieldSchema(name="case_id", dtype=DataType.VARCHAR, max_length=128, is_partition_key=True),
+        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=dim)
+    ]
+    schema = CollectionSchema(fields, description="Case chunk vectors, partitioned by case_id")
+    coll = Collection(name, schema=schema, num_partitions=num_partitions)
+    coll.create_index(field_name="embedding", index_params=INDEX_PARAMS)
+    return coll
+
+def case_chunk_ids(coll, case_id):
+    expr = f"case_id == {json.dumps(case_id)}"
+    it = coll.query_iterator(batch_size=INSERT_BATCH * 4, expr=expr, output_fields=["chunk_id"])
+    ids = set()
+    try:
+        while True:
+            page = it.next()
+            if not page:
+                break
+            ids.update(r["chunk_id"] for r in page)
+    finally:
+        it.close()
+    return ids
+
+def index_shared(case_id, chunk_ids, vecs, coll_prefix, full=False):
+    dim = int(vecs.shape[1])
+    coll = shared_collection(coll_prefix, dim)
+    coll.load()
+    existing = case_chunk_ids(coll, case_id)
+    # chunk ids are content-addressed: an id already in the collection holds the same text
+    rows = [i for i, cid in enumerate(chunk_ids) if full or cid not in existing]
+    for start in range(0, len(rows), INSERT_BATCH):
+        idx = rows[start:start + INSERT_BATCH]
+        coll.upsert([[chunk_ids[i] for i in idx], [case_id] * len(idx), vecs[idx].tolist()])
+    removed = list(existing - set(chunk_ids))
+    for start in range(0, len(removed), INSERT_BATCH):
+        coll.delete(f"chunk_id in {json.dumps(removed[start:start + INSERT_BATCH], ensure_ascii=False)}")
+    coll.flush()
+    write_stamp(case_id, coll_prefix, len(chunk_ids))
+    print(f"[ok] milvus upserted {len(rows)} / removed {len(removed)} / unchanged {len(chunk_ids) - len(rows)} "
+          f"chunks of case {case_id} into {coll_prefix} (dim={dim})")
+    return 0
+
+def main(case_id, host="milvus", port="19530", coll_prefix="legal_chunks", layout=None, model_name=None,
+         workers=None, max_seq_length=None):
+    layout = layout or os.environ.get("MILVUS_LAYOUT", "shared")
     parsed = f"/data/cases/{case_id}/parsed/chunks.jsonl"
     if not os.path.exists(parsed):
         print("[!] parsed not found:", parsed); return 1
     # connect
     connections.connect(host=host, port=port)
-    # ensure embedding model dimension matches your embedder
-    model = SentenceTransformer("BAAI/bge-large-zh")
-    dim = model.get_sentence_embedding_dimension()
+    # resolve vectors before touching the collection, so the drop/recreate window stays short
+    chunk_ids, vecs = ensure_artifact(case_id, model_name or DEFAULT_MODEL, chunks_path=parsed,
+                                      **encoder_options(workers, max_seq_length))
+    if not chunk_ids:
+        print("[!] no chunks in", parsed); return 1
+    if layout == "shared":
+        return index_shared(case_id, chunk_ids, vecs, coll_prefix, full=bool(os.environ.get("MILVUS_FULL_UPSERT")))
+    # embedding dimension comes from the artifact
+    dim = int(vecs.shape[1])
     coll_name = f"{coll_prefix}_{case_id}"
     if utility.has_collection(coll_name):
         print("[i] collection exists, drop and recreate for demo")
@@ -30,26 +105,18 @@ def main(case_id, host="milvus", port="19530", coll_prefix="legal_chunks"):
     ]
     schema = CollectionSchema(fields, description="Case chunks vectors")
     coll = Collection(coll_name, schema=schema)
-    # load chunks and embed
-    chunks = []
-    with open(parsed, "r", encoding="utf-8") as f:
-        for line in f:
-            chunks.append(json.loads(line))
-    texts = [c.get("text","") for c in chunks]
-    vecs = model.encode(texts, normalize_embeddings=True)
-    # prepare insert: chunk_id list and vectors
-    chunk_ids = [c.get("chunk_id") for c in chunks]
-    entities = [chunk_ids, vecs.tolist()]
-    insert_result = coll.insert(entities)
+    # insert in slices straight from the memmap instead of materializing every vector as a list
+    for start in range(0, len(chunk_ids), INSERT_BATCH):
+        coll.insert([chunk_ids[start:start + INSERT_BATCH], vecs[start:start + INSERT_BATCH].tolist()])
     # create index - tuned parameters
-    index_params = {"index_type":"HNSW", "metric_type":"IP", "params":{"M":32, "efConstruction":200}}
-    coll.create_index(field_name="embedding", index_params=index_params)
+    coll.create_index(field_name="embedding", index_params=INDEX_PARAMS)
     coll.load()
-    print(f"[ok] milvus indexed {len(chunks)} chunks into {coll_name} (dim={dim})")
+    write_stamp(case_id, coll_name, len(chunk_ids))
+    print(f"[ok] milvus indexed {len(chunk_ids)} chunks into {coll_name} (dim={dim})")
     return 0
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python workers/milvus_indexer.py <case_id> [host] [port] [coll_prefix]")
+        print("Usage: python workers/milvus_indexer.py <case_id> [host] [port] [coll_prefix] [shared|per_case] [model_name]")
         sys.exit(1)
     sys.exit(main(sys.argv[1], *(sys.argv[2:] if len(sys.argv)>2 else [])))
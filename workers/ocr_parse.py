@@ -3,39 +3,95 @@ workers/ocr_parse.py
 - Extract text from PDFs, images, Word docs.
 - Use PyMuPDF/pdfplumber for text-based PDFs; PaddleOCR for scanned PDFs/images.
 - Output JSONL chunks and a merged TXT to /data/cases/<case_id>/parsed/
+- chunk_id is content-addressed: hash(case_id, asset sha256, page, segment, text hash), so re-parsing an
+  unchanged asset yields the same ids and index_builder --incremental only touches what changed.
+- Scanned pages are rasterized in memory (numpy, no temp PNGs) from a single open fitz document.
+- --workers N (or OCR_WORKERS): parallel parse. Text-layer extraction runs per PDF on a light process pool;
+  pages without a text layer and images go to a pool of warm PaddleOCR workers in small page batches (each
+  worker keeps its PDFs open). Progress is reported in pages/sec.
+- Parse cache: per-asset page results are stored under parsed/cache/<asset sha256>.<parser version>.json and
+  listed in parsed/parse_manifest.json; only new or modified assets are parsed, the case outputs are assembled
+  from the cache and rewritten only if their content changed. --no-cache forces a full re-parse.
+Usage: python workers/ocr_parse.py <case_id> [--workers N] [--ocr-threads T] [--dpi 200] [--no-cache]
 """
-import os, sys, json, uuid, pathlib, fitz, pdfplumber
+import os, sys, json, time, pathlib, argparse, fitz, pdfplumber
+import numpy as np
+import multiprocessing as mp
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from PIL import Image
-from paddleocr import PaddleOCR
+# pure chunk/file helpers live in chunk_io so asr_transcribe does not pull in fitz/pdfplumber/PIL
+from chunk_io import file_sha256, write_if_changed, load_asr_chunks, merged_label, make_chunk_id
+
+OCR_DPI = 200
+OCR_PAGE_BATCH = 4
+IMAGE_EXTS = (".png",".jpg",".jpeg",".bmp",".tiff")
+PARSE_EXTS = (".pdf", ".docx", ".txt") + IMAGE_EXTS
+# bump when extraction logic changes so cached page results are re-parsed
+PARSER_REVISION = 1
 
 def ensure_dir(p):
     os.makedirs(p, exist_ok=True)
 
-def extract_pdf(pdf_path, ocr=None):
-    texts = []
+def parser_version(dpi=OCR_DPI):
+    """
+    Cache key component: parser revision, OCR model package version and raster dpi.
+    """
+    try:
+        from importlib.metadata import version
+        ocr_ver = version("paddleocr")
+    except Exception:
+        ocr_ver = "unknown"
+    return f"r{PARSER_REVISION}-paddleocr{ocr_ver}-dpi{dpi}"
+
+def cache_path(out_dir, asset_sha, version):
+    return os.path.join(out_dir, "cache", f"{asset_sha}.{version}.json")
+
+def new_ocr(threads=None):
+    from paddleocr import PaddleOCR
+    kw = {"cpu_threads": int(threads)} if threads else {}
+    return PaddleOCR(use_angle_cls=True, lang="ch", show_log=False, **kw)
+
+def ocr_text(ocr, img):
+    res = ocr.ocr(img, cls=True)
+    return "\n".join([line[1][0] for line in (res[0] or [])])
+
+def rasterize(doc, page_no, dpi=OCR_DPI):
+    """
+    Page (1-based) of an open fitz document -> BGR uint8 array, as PaddleOCR expects.
+    """
+    pix = doc.load_page(page_no - 1).get_pixmap(dpi=dpi, alpha=False)
+    img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.h, pix.w, pix.n)
+    if pix.n == 1:
+        img = np.repeat(img, 3, axis=2)
+    return np.ascontiguousarray(img[..., 2::-1])
+
+def pdf_text_layer(pdf_path):
+    """
+    Returns ({page: text} for pages with a text layer, [pages needing OCR]).
+    """
+    texts, scanned = {}, []
     with pdfplumber.open(pdf_path) as pdf:
         for i, page in enumerate(pdf.pages, start=1):
             t = page.extract_text() or ""
             if t.strip():
-                texts.append({"type":"text","page":i,"text":t})
+                texts[i] = t
             else:
-                # fallback OCR
-                if ocr:
-                    # rasterize page
-                    with fitz.open(pdf_path) as doc:
-                        pix = doc.load_page(i-1).get_pixmap(dpi=200)
-                        img_path = pdf_path + f".p{i}.png"
-                        pix.save(img_path)
-                        ocr_res = ocr.ocr(img_path, cls=True)
-                        txt = "\n".join([line[1][0] for line in (ocr_res[0] or [])])
-                        texts.append({"type":"ocr","page":i,"text":txt})
-                        os.remove(img_path)
-    return texts
+                scanned.append(i)
+    return texts, scanned
+
+def extract_pdf(pdf_path, ocr=None, dpi=OCR_DPI):
+    texts, scanned = pdf_text_layer(pdf_path)
+    items = {i: {"type":"text","page":i,"text":t} for i, t in texts.items()}
+    if ocr and scanned:
+        # fallback OCR, one open document for all scanned pages
+        with fitz.open(pdf_path) as doc:
+            for i in scanned:
+                items[i] = {"type":"ocr","page":i,"text":ocr_text(ocr, rasterize(doc, i, dpi))}
+    return [items[i] for i in sorted(items)]
 
 def extract_image(img_path, ocr):
-    res = ocr.ocr(img_path, cls=True)
-    txt = "\n".join([line[1][0] for line in (res[0] or [])])
-    return [{"type":"ocr","page":1,"text":txt}]
+    return [{"type":"ocr","page":1,"text":ocr_text(ocr, img_path)}]
 
 def extract_docx(docx_path):
     try:
@@ -46,50 +102,188 @@ def extract_docx(docx_path):
     paras = [p.text for p in doc.paragraphs if p.text.strip()]
     return [{"type":"text","page":i+1,"text":t} for i,t in enumerate(paras)]
 
-def main(case_id):
+def extract_plain(p):
+    low = p.lower()
+    if low.endswith(".docx"):
+        return extract_docx(p)
+    if low.endswith(".txt"):
+        with open(p, "r", encoding="utf-8", errors="ignore") as f:
+            return [{"type":"text","page":1,"text":f.read()}]
+    return None
+
+def parse_sequential(paths, dpi=OCR_DPI):
+    ocr = _OCR  # warm model of a long-lived worker (warm_ocr), if any
+    out = {}
+    for p in paths:
+        low = p.lower()
+        if low.endswith(".pdf") or low.endswith(IMAGE_EXTS):
+            ocr = ocr or new_ocr()
+            out[p] = extract_pdf(p, ocr, dpi) if low.endswith(".pdf") else extract_image(p, ocr)
+        else:
+            items = extract_plain(p)
+            if items is not None:
+                out[p] = items
+    return out
+
+# --- parallel mode: per-process state of the OCR workers ---
+_OCR = None
+_DOCS = OrderedDict()  # pdf path -> open fitz document (small LRU)
+_MAX_OPEN_DOCS = 4
+
+def warm_ocr(threads=None):
+    """
+    Load PaddleOCR once for this process; parse_sequential reuses it (Celery OCR workers, api/tasks).
+    """
+    global _OCR
+    if _OCR is None:
+        _OCR = new_ocr(threads)
+    return _OCR
+
+def _init_ocr_worker(threads):
+    global _OCR
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    _OCR = new_ocr(threads)
+
+def _open_doc(path):
+    doc = _DOCS.pop(path, None) or fitz.open(path)
+    _DOCS[path] = doc
+    while len(_DOCS) > _MAX_OPEN_DOCS:
+        _DOCS.popitem(last=False)[1].close()
+    return doc
+
+def _ocr_pages(path, pages, dpi):
+    """
+    OCR a batch of pages of one PDF (pages=None: the file is an image). Returns (path, [(page, text)]).
+    """
+    if pages is None:
+        return path, [(1, ocr_text(_OCR, path))]
+    doc = _open_doc(path)
+    return path, [(i, ocr_text(_OCR, rasterize(doc, i, dpi))) for i in pages]
+
+def _text_task(path):
+    if path.lower().endswith(".pdf"):
+        return path, "pdf", pdf_text_layer(path)
+    return path, "plain", extract_plain(path)
+
+def parse_parallel(paths, workers, ocr_threads=1, dpi=OCR_DPI):
+    """
+    Text-layer pages and OCR pages are scheduled on separate pools; OCR pages go out as soon as
+    their PDF's text layer has been read.
+    """
+    ctx = mp.get_context("spawn")  # paddle is not fork-safe
+    pages = {}          # path -> {page: item}
+    done = total = 0
+    t0 = time.monotonic()
+    last = t0
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_ocr_worker,
+                             initargs=(ocr_threads,)) as ocr_pool, \
+         ProcessPoolExecutor(max_workers=max(1, min(workers, 4)), mp_context=ctx) as text_pool:
+        ocr_futs = []
+        text_futs = []
+        for p in paths:
+            if p.lower().endswith(IMAGE_EXTS):
+                pages[p] = {}
+                total += 1
+                ocr_futs.append(ocr_pool.submit(_ocr_pages, p, None, dpi))
+            else:
+                text_futs.append(text_pool.submit(_text_task, p))
+        for fut in as_completed(text_futs):
+            p, kind, res = fut.result()
+            if kind == "plain":
+                if res is not None:
+                    pages[p] = {it["page"]: it for it in res}
+                continue
+            texts, scanned = res
+            pages[p] = {i: {"type":"text","page":i,"text":t} for i, t in texts.items()}
+            done += len(texts)
+            total += len(texts) + len(scanned)
+            for start in range(0, len(scanned), OCR_PAGE_BATCH):
+                ocr_futs.append(ocr_pool.submit(_ocr_pages, p, scanned[start:start + OCR_PAGE_BATCH], dpi))
+        for fut in as_completed(ocr_futs):
+            p, res = fut.result()
+            for i, txt in res:
+                pages[p][i] = {"type":"ocr","page":i,"text":txt}
+            done += len(res)
+            now = time.monotonic()
+            if now - last >= 5:
+                last = now
+                print(f"[i] parsed {done}/{total} pages, {done / (now - t0):.1f} pages/s")
+    elapsed = time.monotonic() - t0
+    print(f"[i] parsed {done} pages in {elapsed:.1f}s ({done / max(elapsed, 1e-9):.1f} pages/s, {workers} OCR workers)")
+    return {p: [items[i] for i in sorted(items)] for p, items in pages.items()}
+
+def main(case_id, workers=1, ocr_threads=None, dpi=OCR_DPI, use_cache=True, transform=None):
     assets_dir = f"/data/cases/{case_id}/assets"
     out_dir = f"/data/cases/{case_id}/parsed"
-    ensure_dir(out_dir)
-    ocr = PaddleOCR(use_angle_cls=True, lang="ch", show_log=False)
-    chunks = []
-    for name in os.listdir(assets_dir):
-        p = os.path.join(assets_dir, name)
-        low = name.lower()
-        if low.endswith(".pdf"):
-            items = extract_pdf(p, ocr)
-        elif low.endswith((".png",".jpg",".jpeg",".bmp",".tiff")):
-            items = extract_image(p, ocr)
-        elif low.endswith(".docx"):
-            items = extract_docx(p)
-        elif low.endswith(".txt"):
-            with open(p, "r", encoding="utf-8", errors="ignore") as f:
-                items = [{"type":"text","page":1,"text":f.read()}]
+    ensure_dir(os.path.join(out_dir, "cache"))
+    version = parser_version(dpi)
+    names = [n for n in sorted(os.listdir(assets_dir)) if n.lower().endswith(PARSE_EXTS)]
+    paths = [os.path.join(assets_dir, n) for n in names]
+    shas = {p: file_sha256(p) for p in paths}
+    parsed, todo = {}, []
+    for p in paths:
+        cp = cache_path(out_dir, shas[p], version)
+        if use_cache and os.path.exists(cp):
+            with open(cp, "r", encoding="utf-8") as f:
+                parsed[p] = json.load(f)["items"]
         else:
+            todo.append(p)
+    print(f"[i] assets: {len(paths)} total, {len(paths) - len(todo)} cached, {len(todo)} to parse ({version})")
+    if todo:
+        if workers and workers > 1:
+            ncpu = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+            fresh = parse_parallel(todo, workers, ocr_threads or max(1, ncpu // workers), dpi)
+        else:
+            fresh = parse_sequential(todo, dpi)
+        for p, items in fresh.items():
+            write_if_changed(cache_path(out_dir, shas[p], version),
+                             json.dumps({"asset": os.path.basename(p), "sha256": shas[p], "parser": version,
+                                         "items": items}, ensure_ascii=False))
+        parsed.update(fresh)
+    manifest = {}
+    chunks = []
+    for name, p in zip(names, paths):
+        items = parsed.get(p)
+        if items is None:
             continue
-        for it in items:
-            chunk_id = str(uuid.uuid4())
+        asset_sha = shas[p]
+        manifest[name] = {"sha256": asset_sha, "parser": version, "pages": len(items),
+                          "cache": os.path.relpath(cache_path(out_dir, asset_sha, version), out_dir)}
+        for seg, it in enumerate(items):
             chunks.append({
-                "chunk_id": chunk_id,
+                "chunk_id": make_chunk_id(case_id, asset_sha, it.get("page"), seg, it["text"]),
                 "source_type": "case",
                 "source_id": name,
                 "text": it["text"],
-                "meta": {"page": it.get("page"), "asset": name}
+                "meta": {"page": it.get("page"), "asset": name, "case_id": case_id, "asset_sha256": asset_sha}
             })
+    if transform is not None:
+        # records streamed through a downstream step (workers/pipeline_runner.py, e.g. text/segment)
+        chunks = list(transform(chunks))
+    # keep hearing transcripts produced by asr_transcribe
+    chunks += load_asr_chunks(out_dir, sorted(os.listdir(assets_dir)))
     # write jsonl
     jl = os.path.join(out_dir, "chunks.jsonl")
-    with open(jl, "w", encoding="utf-8") as f:
-        for c in chunks:
-            f.write(json.dumps(c, ensure_ascii=False) + "\n")
+    changed = write_if_changed(jl, "".join(json.dumps(c, ensure_ascii=False) + "\n" for c in chunks))
     # write merged txt
     merged = os.path.join(out_dir, "merged.txt")
-    with open(merged, "w", encoding="utf-8") as f:
-        for c in chunks:
-            f.write(f"【{c['meta'].get('asset')} p.{c['meta'].get('page')}】\n{c['text']}\n\n")
-    print(f"[ok] parsed {len(chunks)} chunks -> {jl}")
+    write_if_changed(merged, "".join(f"【{merged_label(c)}】\n{c['text']}\n\n" for c in chunks))
+    write_if_changed(os.path.join(out_dir, "parse_manifest.json"), json.dumps(manifest, ensure_ascii=False, indent=2))
+    # drop cache entries of assets that were removed or replaced
+    live = {os.path.basename(m["cache"]) for m in manifest.values()}
+    for fn in os.listdir(os.path.join(out_dir, "cache")):
+        if fn not in live:
+            os.remove(os.path.join(out_dir, "cache", fn))
+    print(f"[ok] parsed {len(chunks)} chunks -> {jl}" + ("" if changed else " (unchanged)"))
     return 0
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python workers/ocr_parse.py <case_id>")
-        sys.exit(1)
-    sys.exit(main(sys.argv[1]))
+    ap = argparse.ArgumentParser(description="Parse case assets into chunks.jsonl / merged.txt")
+    ap.add_argument("case_id")
+    ap.add_argument("--workers", type=int, default=int(os.environ.get("OCR_WORKERS", 1)), help="OCR processes")
+    ap.add_argument("--ocr-threads", type=int, default=None, help="CPU threads per OCR worker")
+    ap.add_argument("--dpi", type=int, default=OCR_DPI)
+    ap.add_argument("--no-cache", action="store_true", help="ignore cached page results and re-parse every asset")
+    args = ap.parse_args()
+    sys.exit(main(args.case_id, args.workers, args.ocr_threads, args.dpi, use_cache=not args.no_cache))
@@ -0,0 +1,183 @@
+"""
+workers/onnx_backend.py
+- Selectable CPU inference backend for the embedder (SentenceTransformer) and the reranker (CrossEncoder).
+- backend "torch": the original sentence-transformers path.
+- backend "onnx": export the model to ONNX once, apply dynamic int8 quantization and run it with onnxruntime
+  (tuned intra-op threads). Exports are cached under $ONNX_MODEL_DIR/<kind>/<model slug>/.
+- Select with INFERENCE_BACKEND=torch|onnx (or pass backend=...); ORT_INTRA_OP_THREADS sets the thread count.
+- Check drift against the torch path with scripts/check_onnx_drift.py before switching production nodes.
+Usage (export ahead of time):
+  python workers/onnx_backend.py embed BAAI/bge-large-zh
+  python workers/onnx_backend.py rerank cross-encoder/ms-marco-MiniLM-L-6-v2
+"""
+import os, sys, json, re
+import numpy as np
+
+ONNX_MODEL_DIR = os.environ.get("ONNX_MODEL_DIR", "/models/onnx")
+
+def default_backend():
+    return os.environ.get("INFERENCE_BACKEND", "torch").lower()
+
+def model_slug(model_name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name.strip("/"))
+
+def export_dir(kind: str, model_name: str, root: str=None) -> str:
+    return os.path.join(root or ONNX_MODEL_DIR, kind, model_slug(model_name))
+
+def _export(module, tokenizer, out_dir, output_name, quantize=True, opset=14):
+    import torch
+    os.makedirs(out_dir, exist_ok=True)
+    dummy = tokenizer(["示例文本", "另一段较长的示例文本"], padding=True, return_tensors="pt")
+    input_names = list(dummy.keys())
+
+    class _Wrap(torch.nn.Module):
+        # unwrap ModelOutput so the graph has a single tensor output
+        def __init__(self, m):
+            super().__init__()
+            self.m = m
+        def forward(self, *args):
+            return self.m(**dict(zip(input_names, args)))[0]
+
+    fp32_path = os.path.join(out_dir, "model.onnx")
+    dyn = {n: {0: "batch", 1: "seq"} for n in input_names}
+    dyn[output_name] = {0: "batch", 1: "seq"} if output_name == "token_embeddings" else {0: "batch"}
+    module.eval()
+    with torch.no_grad():
+        torch.onnx.export(_Wrap(module), tuple(dummy[n] for n in input_names), fp32_path,
+                          input_names=input_names, output_names=[output_name],
+                          dynamic_axes=dyn, opset_version=opset)
+    tokenizer.save_pretrained(out_dir)
+    model_file = "model.onnx"
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(fp32_path, os.path.join(out_dir, "model.int8.onnx"), weight_type=QuantType.QInt8)
+        model_file = "model.int8.onnx"
+    return input_names, model_file
+
+def export_embedder(model_name: str, out_dir: str=None, quantize: bool=True):
+    from sentence_transformers import SentenceTransformer
+    out_dir = out_dir or export_dir("embed", model_name)
+    st = SentenceTransformer(model_name, device="cpu")
+    pooling = "cls"
+    for mod in st:
+        if hasattr(mod, "get_pooling_mode_str"):
+            pooling = mod.get_pooling_mode_str()
+    input_names, model_file = _export(st[0].auto_model, st.tokenizer, out_dir, "token_embeddings", quantize)
+    meta = {"kind": "embed", "source": model_name, "pooling": pooling, "max_length": int(st.max_seq_length or 512),
+            "dim": int(st.get_sentence_embedding_dimension()), "inputs": input_names, "model_file": model_file,
+            "quantized": quantize}
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    print(f"[ok] exported embedder {model_name} -> {out_dir} ({model_file}, pooling={pooling})")
+    return out_dir
+
+def export_cross_encoder(model_name: str, out_dir: str=None, quantize: bool=True):
+    from sentence_transformers import CrossEncoder
+    out_dir = out_dir or export_dir("rerank", model_name)
+    ce = CrossEncoder(model_name, device="cpu")
+    num_labels = int(ce.model.config.num_labels)
+    input_names, model_file = _export(ce.model, ce.tokenizer, out_dir, "logits", quantize)
+    meta = {"kind": "rerank", "source": model_name, "num_labels": num_labels,
+            # CrossEncoder applies a sigmoid to single-label models by default
+            "activation": "sigmoid" if num_labels == 1 else "identity",
+            "max_length": int(getattr(ce, "max_length", None) or min(ce.tokenizer.model_max_length, 512)),
+            "inputs": input_names, "model_file": model_file, "quantized": quantize}
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    print(f"[ok] exported cross-encoder {model_name} -> {out_dir} ({model_file})")
+    return out_dir
+
+class _OrtModel:
+    def __init__(self, model_dir: str, threads: int=None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        with open(os.path.join(model_dir, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = int(threads or os.environ.get("ORT_INTRA_OP_THREADS", 0) or os.cpu_count() or 1)
+        opts.inter_op_num_threads = 1
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(os.path.join(model_dir, self.meta["model_file"]), opts,
+                                            providers=["CPUExecutionProvider"])
+        self.max_length = int(self.meta.get("max_length", 512))
+
+    def _run(self, enc):
+        feeds = {n: np.asarray(enc[n], dtype=np.int64) for n in self.meta["inputs"]}
+        return self.session.run(None, feeds)[0]
+
+class OnnxEmbedder(_OrtModel):
+    """Subset of the SentenceTransformer API used by the API and workers."""
+    def get_sentence_embedding_dimension(self):
+        return int(self.meta["dim"])
+
+    def encode(self, texts, batch_size: int=32, normalize_embeddings: bool=False, **_):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        out = np.zeros((len(texts), self.get_sentence_embedding_dimension()), dtype=np.float32)
+        # sort by length so each batch pads to similar lengths
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            enc = self.tokenizer([texts[i] for i in idx], padding=True, truncation=True,
+                                 max_length=self.max_length, return_tensors="np")
+            hidden = self._run(enc)
+            if self.meta.get("pooling") == "cls":
+                emb = hidden[:, 0]
+            else:
+                mask = enc["attention_mask"][..., None].astype(np.float32)
+                emb = (hidden * mask).sum(1) / np.clip(mask.sum(1), 1e-9, None)
+            out[idx] = emb
+        if normalize_embeddings:
+            out /= np.clip(np.linalg.norm(out, axis=1, keepdims=True), 1e-12, None)
+        return out[0] if single else out
+
+class OnnxCrossEncoder(_OrtModel):
+    """Subset of the CrossEncoder API (predict) used by the rerankers."""
+    def predict(self, pairs, batch_size: int=32, **_):
+        pairs = list(pairs)
+        scores = np.zeros((len(pairs), int(self.meta.get("num_labels", 1))), dtype=np.float32)
+        order = sorted(range(len(pairs)), key=lambda i: len(pairs[i][0]) + len(pairs[i][1]))
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            enc = self.tokenizer([pairs[i][0] for i in idx], [pairs[i][1] for i in idx], padding=True,
+                                 truncation="longest_first", max_length=self.max_length, return_tensors="np")
+            scores[idx] = self._run(enc)
+        if self.meta.get("activation") == "sigmoid":
+            scores = 1.0 / (1.0 + np.exp(-scores))
+        return scores[:, 0] if scores.shape[1] == 1 else scores
+
+def load_embedder(model_name: str, backend: str=None, threads: int=None):
+    """
+    Return a SentenceTransformer (torch) or OnnxEmbedder (onnx); exports on first use if needed.
+    """
+    backend = (backend or default_backend()).lower()
+    if backend == "onnx":
+        d = export_dir("embed", model_name)
+        if not os.path.exists(os.path.join(d, "meta.json")):
+            export_embedder(model_name, d)
+        return OnnxEmbedder(d, threads)
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+def load_cross_encoder(model_name: str, backend: str=None, threads: int=None):
+    backend = (backend or default_backend()).lower()
+    if backend == "onnx":
+        d = export_dir("rerank", model_name)
+        if not os.path.exists(os.path.join(d, "meta.json")):
+            export_cross_encoder(model_name, d)
+        return OnnxCrossEncoder(d, threads)
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(model_name)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("embed", "rerank"):
+        print("Usage: python workers/onnx_backend.py <embed|rerank> <model_name> [out_dir] [--no-quantize]")
+        sys.exit(1)
+    args = [a for a in sys.argv[2:] if not a.startswith("--")]
+    quantize = "--no-quantize" not in sys.argv
+    if sys.argv[1] == "embed":
+        export_embedder(args[0], args[1] if len(args) > 1 else None, quantize)
+    else:
+        export_cross_encoder(args[0], args[1] if len(args) > 1 else None, quantize)
@@ -6,7 +6,7 @@ Usage:
 Outputs top-K scored passages to stdout as JSON.
 """
 import sys, json, os
-from sentence_transformers import CrossEncoder
+from onnx_backend import load_cross_encoder
 
 def load_chunks(path):
     with open(path, "r", encoding="utf-8") as f:
@@ -22,7 +22,7 @@ def main():
     top_k = int(sys.argv[3]) if len(sys.argv) > 3 else 10
     # model name can be changed; using a reasonably small cross-encoder for demo
     model_name = "cross-encoder/ms-marco-MiniLM-L-6-v2"
-    model = CrossEncoder(model_name)
+    model = load_cross_encoder(model_name)  # INFERENCE_BACKEND=torch|onnx
     chunks = list(load_chunks(chunks_path))
     pairs = [[query, c.get("text","")] for c in chunks]
     scores = model.predict(pairs, batch_size=16)
@@ -0,0 +1,77 @@
+"""
+workers/text_segment.py
+- Chinese-aware tokenization for Postgres full-text search with the 'simple' config, shared by
+  index_builder (stored chunks.tsv) and the API (query side), so both sides segment identically.
+- jieba (search mode) when installed; otherwise CJK runs become overlapping character bigrams
+  (single characters for 1-char runs). Latin words and numbers are kept as lower-cased tokens.
+- TEXT_SEGMENTER=jieba|bigram selects the segmenter explicitly (configs/app.yaml text.segmenter, docker-compose for
+  api and celery_index); "jieba" fails loudly when jieba is not installed instead of silently degrading to bigrams.
+  "auto" (the default when unset) takes jieba if importable. It must be the same for indexing and querying:
+  index_builder stores segmenter() next to chunks.tsv (chunks.tsv_segmenter) and the API warns on a mismatch.
+"""
+import os, re, unicodedata
+
+_CJK = r"\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_TOKEN = re.compile(rf"[{_CJK}]+|[A-Za-z0-9]+(?:[._-][A-Za-z0-9]+)*")
+_IS_CJK = re.compile(rf"[{_CJK}]")
+# characters with meaning in to_tsquery syntax
+_TSQUERY_UNSAFE = re.compile(r"[&|!():*'\\<>\s]")
+
+SEGMENTERS = ("jieba", "bigram")
+
+_JIEBA = None
+
+def _jieba():
+    global _JIEBA
+    if _JIEBA is None:
+        name = os.environ.get("TEXT_SEGMENTER", "auto").lower()
+        if name not in SEGMENTERS + ("auto",):
+            raise ValueError(f"unknown TEXT_SEGMENTER: {name} (expected jieba, bigram or auto)")
+        _JIEBA = False
+        if name != "bigram":
+            try:
+                import jieba
+                jieba.setLogLevel(60)
+                _JIEBA = jieba
+            except ImportError:
+                if name == "jieba":
+                    raise RuntimeError("TEXT_SEGMENTER=jieba but jieba is not installed")
+    return _JIEBA
+
+def segmenter() -> str:
+    """
+    Name of the segmenter in effect ("jieba" or "bigram"); stored with chunks.tsv and compared on the query side.
+    """
+    return "jieba" if _jieba() else "bigram"
+
+def bigrams(run: str):
+    if len(run) == 1:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+def tokens(text: str):
+    text = unicodedata.normalize("NFKC", text or "")
+    out = []
+    jb = _jieba()
+    for m in _TOKEN.finditer(text):
+        tok = m.group(0)
+        if not _IS_CJK.match(tok):
+            out.append(tok.lower())
+        elif jb:
+            out.extend(w for w in jb.cut_for_search(tok) if w.strip())
+        else:
+            out.extend(bigrams(tok))
+    return out
+
+def segment(text: str) -> str:
+    """
+    Space-joined tokens, ready for to_tsvector('simple', ...).
+    """
+    return " ".join(tokens(text))
+
+def tsquery(text: str, op: str="|") -> str:
+    """
+    Query text -> to_tsquery('simple', ...) expression (OR of quoted lexemes by default), "" if no tokens.
+    """
+    seen = dict.fromkeys(t for t in (_TSQUERY_UNSAFE.sub("", t) for t in tokens(text)) if t)
+    return f" {op} ".join(f"'{t}'" for t in seen)
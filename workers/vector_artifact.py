@@ -0,0 +1,166 @@
+"""
+workers/vector_artifact.py
+- Embed a case once and share the vectors between the pgvector writer (index_builder) and the Milvus writer
+  (milvus_indexer), so both stores hold identical vectors and the case is not encoded twice.
+- Artifact per case and model under /data/cases/<case_id>/parsed/vectors/:
+    <model>.npy        float32 (n, dim), opened with mmap_mode="r" by readers (no full copy into RAM)
+    <model>.json       manifest: chunk ids (row order), model fingerprint, sha256 of chunks.jsonl, dim
+- The artifact is reused while chunks.jsonl and the model fingerprint are unchanged. On rebuild, rows of
+  chunk ids present in the previous artifact are copied over (chunk ids are content-addressed), so only
+  new chunks are encoded.
+- Every reader takes the model and encoder settings from encoder_options() (EMBED_MODEL, EMBED_WORKERS,
+  EMBED_MAX_SEQ_LENGTH unless overridden), so they all compute the same fingerprint and share one artifact.
+Usage:
+  python workers/vector_artifact.py <case_id> [model_name] [--workers N] [--max-seq-length L] [--batch-size B]
+"""
+import os, sys, json, hashlib, argparse, itertools
+import numpy as np
+from onnx_backend import default_backend, model_slug, export_dir
+
+def artifact_paths(case_id, model_name):
+    base = os.path.join(f"/data/cases/{case_id}/parsed/vectors", model_slug(model_name))
+    return base + ".npy", base + ".json"
+
+def file_sha256(path, bufsize=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(bufsize), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def model_fingerprint(model_name, max_seq_length=None, backend=None):
+    """
+    Anything that changes the vectors: model name/weights, inference backend, sequence cap.
+    """
+    backend = (backend or default_backend()).lower()
+    parts = {"model": model_name, "backend": backend, "max_seq_length": max_seq_length}
+    cfg = os.path.join(model_name, "config.json")
+    if os.path.exists(cfg):
+        # local model dir: include its config so swapped weights invalidate the artifact
+        parts["config_sha256"] = file_sha256(cfg)
+    meta = os.path.join(export_dir("embed", model_name), "meta.json")
+    if backend == "onnx" and os.path.exists(meta):
+        # re-export / quantized vs fp32 changes the vectors
+        parts["onnx_meta_sha256"] = file_sha256(meta)
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def _iter_chunks(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def load_artifact(case_id, model_name, max_seq_length=None, chunks_path=None):
+    """
+    Returns (chunk_ids, vectors memmap) if the artifact matches chunks.jsonl and the model fingerprint, else None.
+    """
+    npy, manifest_path = artifact_paths(case_id, model_name)
+    chunks_path = chunks_path or f"/data/cases/{case_id}/parsed/chunks.jsonl"
+    if not (os.path.exists(npy) and os.path.exists(manifest_path)):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("fingerprint") != model_fingerprint(model_name, max_seq_length):
+        return None
+    if manifest.get("chunks_sha256") != file_sha256(chunks_path):
+        return None
+    vecs = np.load(npy, mmap_mode="r")
+    if vecs.shape[0] != len(manifest["chunk_ids"]):
+        return None
+    return manifest["chunk_ids"], vecs
+
+def build_artifact(case_id, model_name, workers=1, max_seq_length=None, batch_size=1024, chunks_path=None):
+    from embed_pool import load_encoder, close_encoder
+    chunks_path = chunks_path or f"/data/cases/{case_id}/parsed/chunks.jsonl"
+    npy, manifest_path = artifact_paths(case_id, model_name)
+    os.makedirs(os.path.dirname(npy), exist_ok=True)
+    fingerprint = model_fingerprint(model_name, max_seq_length)
+    chunks_sha = file_sha256(chunks_path)
+    chunk_ids = [c["chunk_id"] for c in _iter_chunks(chunks_path)]
+
+    # rows we can carry over from the previous artifact of the same model fingerprint
+    prev_rows, prev = {}, None
+    if os.path.exists(npy) and os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            old = json.load(f)
+        if old.get("fingerprint") == fingerprint:
+            prev = np.load(npy, mmap_mode="r")
+            prev_rows = {cid: i for i, cid in enumerate(old["chunk_ids"]) if i < prev.shape[0]}
+
+    tmp_npy, tmp_manifest = npy + ".tmp.npy", manifest_path + ".tmp"
+    out, model, dim = None, None, prev.shape[1] if prev is not None else None
+    reused = encoded = 0
+    it = _iter_chunks(chunks_path)
+    row = 0
+    try:
+        while True:
+            batch = list(itertools.islice(it, batch_size))
+            if not batch:
+                break
+            todo = [(i, c) for i, c in enumerate(batch) if c["chunk_id"] not in prev_rows]
+            new_vecs = None
+            if todo:
+                if model is None:
+                    model = load_encoder(model_name, workers=workers, max_seq_length=max_seq_length)
+                new_vecs = np.asarray(model.encode([c.get("text", "") for _, c in todo], normalize_embeddings=True), dtype=np.float32)
+                dim = dim or new_vecs.shape[1]
+            if out is None:
+                out = np.lib.format.open_memmap(tmp_npy, mode="w+", dtype=np.float32, shape=(len(chunk_ids), dim))
+            for i, c in enumerate(batch):
+                src = prev_rows.get(c["chunk_id"])
+                if src is not None:
+                    out[row + i] = prev[src]
+            for (i, _), v in zip(todo, new_vecs if new_vecs is not None else []):
+                out[row + i] = v
+            reused += len(batch) - len(todo)
+            encoded += len(todo)
+            row += len(batch)
+    finally:
+        close_encoder(model)
+    if out is None:
+        # empty case: nothing to embed
+        dim = dim or 0
+        out = np.lib.format.open_memmap(tmp_npy, mode="w+", dtype=np.float32, shape=(0, dim))
+    out.flush()
+    del out, prev
+    manifest = {"case_id": case_id, "model": model_name, "fingerprint": fingerprint, "chunks_sha256": chunks_sha,
+                "count": len(chunk_ids), "dim": int(dim), "chunk_ids": chunk_ids}
+    with open(tmp_manifest, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    # vectors first, then the manifest that validates them
+    os.replace(tmp_npy, npy)
+    os.replace(tmp_manifest, manifest_path)
+    print(f"[ok] vector artifact {npy}: rows={len(chunk_ids)} dim={dim} encoded={encoded} reused={reused}")
+    return chunk_ids, np.load(npy, mmap_mode="r")
+
+DEFAULT_MODEL = os.environ.get("EMBED_MODEL", "BAAI/bge-large-zh")
+
+def encoder_options(workers=None, max_seq_length=None):
+    """
+    ensure_artifact kwargs shared by index_builder, milvus_indexer, faiss_indexer and pipeline_runner;
+    explicit values win over EMBED_WORKERS / EMBED_MAX_SEQ_LENGTH.
+    """
+    return {"workers": int(workers or os.environ.get("EMBED_WORKERS", 1)),
+            "max_seq_length": int(max_seq_length or os.environ.get("EMBED_MAX_SEQ_LENGTH", 0)) or None}
+
+def ensure_artifact(case_id, model_name, workers=1, max_seq_length=None, batch_size=1024, chunks_path=None):
+    """
+    Load the case's vector artifact, (re)building it first if it is missing or stale.
+    """
+    art = load_artifact(case_id, model_name, max_seq_length, chunks_path)
+    if art is not None:
+        print(f"[i] reusing vector artifact for {case_id} ({len(art[0])} rows)")
+        return art
+    return build_artifact(case_id, model_name, workers, max_seq_length, batch_size, chunks_path)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Embed a case once into a shared memory-mapped vector artifact")
+    ap.add_argument("case_id")
+    ap.add_argument("model_name", nargs="?", default=DEFAULT_MODEL)
+    ap.add_argument("--workers", type=int, default=None, help="default EMBED_WORKERS")
+    ap.add_argument("--max-seq-length", type=int, default=None, help="default EMBED_MAX_SEQ_LENGTH")
+    ap.add_argument("--batch-size", type=int, default=1024)
+    args = ap.parse_args()
+    ensure_artifact(args.case_id, args.model_name, batch_size=args.batch_size,
+                    **encoder_options(args.workers, args.max_seq_length))
+    sys.exit(0)